@@ -0,0 +1,117 @@
+"""End-to-end recording throughput benchmark.
+
+Drives synthetic capture -> AVI -> HDF5 -> channel split -> DB at several
+resolutions and frame rates without a webcam. Run from the repository root:
+
+    python -m benchmarks.throughput --resolutions 640x480 1920x1080 --fps 30 60
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from core import camera, recording
+from core.catalog import get_catalog
+from core.pipeline import RecordingPipeline, BLOCK, POLICIES
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+        except ImportError:
+            return None
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / (1024 * 1024)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def run_case(width, height, fps, frames, pattern, policy, channels):
+    with tempfile.TemporaryDirectory() as tmp:
+        file_base = os.path.join(tmp, "bench")
+        cap = camera.initialize_camera("synthetic", width=width, height=height, fps=fps, pattern=pattern)
+        db_path = os.path.join(tmp, "bench.db")
+        pipeline = RecordingPipeline(cap, frames, fps, policy=policy)
+        # The same stages and post-processing as a real recording.
+        recording.add_storage_stages(pipeline, file_base + ".avi", file_base + ".h5", pipeline.output_fps)
+
+        started = time.monotonic()
+        pipeline.start()
+        pipeline.join()
+        capture_done = time.monotonic()
+
+        recording.finalize_stream(file_base, "bench", "01", "func", pipeline.frame_count, {"fps": fps}, pipeline,
+                                  channels="jpeg" if channels else None, db_path=db_path)
+        get_catalog(db_path).close()
+        finished = time.monotonic()
+        cap.release()
+
+        stats = pipeline.stats()
+        # Capture to HDF5 write latency, NaN for frames the stage dropped.
+        stage_names, latency = pipeline.latency_table()
+        latency_ms = latency[:, stage_names.index("hdf5")]
+        latency_ms = latency_ms[~np.isnan(latency_ms)]
+        if not len(latency_ms):
+            latency_ms = np.zeros(1)
+        return {
+            "resolution": f"{width}x{height}",
+            "target_fps": fps,
+            "frames": pipeline.frame_count,
+            "sustained_fps": stats["achieved_fps"],
+            "latency_p50_ms": float(np.percentile(latency_ms, 50)),
+            "latency_p95_ms": float(np.percentile(latency_ms, 95)),
+            "latency_p99_ms": float(np.percentile(latency_ms, 99)),
+            "capture_seconds": capture_done - started,
+            "post_seconds": finished - capture_done,
+            "stages": stats["stages"],
+            "peak_rss_mb": peak_rss_mb(),
+        }
+
+def parse_resolution(text):
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the recording pipeline with a synthetic camera.")
+    parser.add_argument("--resolutions", nargs="+", default=["640x480", "1280x720", "1920x1080"])
+    parser.add_argument("--fps", nargs="+", type=int, default=[30, 60])
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--pattern", default="noise", choices=camera.SYNTHETIC_PATTERNS)
+    parser.add_argument("--policy", default=BLOCK, choices=POLICIES)
+    parser.add_argument("--no-channels", action="store_true", help="Skip the RGB channel export step")
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    cases = [
+        (width, height, fps, args.frames, args.pattern, args.policy, not args.no_channels)
+        for width, height in map(parse_resolution, args.resolutions)
+        for fps in args.fps
+    ]
+    results = []
+    print(f"{'resolution':>10} {'target':>6} {'fps':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'drop':>5} {'late':>5} {'post s':>7} {'RSS MB':>8}")
+    for case in cases:
+        # A fresh process per case keeps the peak RSS figure per configuration.
+        with multiprocessing.get_context("spawn").Pool(1) as pool:
+            result = pool.apply(run_case, case)
+        results.append(result)
+        dropped = sum(stage["dropped"] for stage in result["stages"].values())
+        late = sum(stage["late"] for stage in result["stages"].values())
+        rss = f"{result['peak_rss_mb']:.0f}" if result["peak_rss_mb"] is not None else "n/a"
+        print(f"{result['resolution']:>10} {result['target_fps']:>6} {result['sustained_fps']:>7.1f} "
+              f"{result['latency_p50_ms']:>8.2f} {result['latency_p95_ms']:>8.2f} {result['latency_p99_ms']:>8.2f} "
+              f"{dropped:>5} {late:>5} {result['post_seconds']:>7.2f} {rss:>8}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=4)
+    return results
+
+if __name__ == '__main__':
+    main()
@@ -15,7 +15,10 @@ if SUPPRESS_STDERR:
         os.dup2(f.fileno(), sys.stderr.fileno())
     suppress_c_stderr()
 
-from ui.main_window import launch_app
-
 if __name__ == '__main__':
-    launch_app()
\ No newline at end of file
+    if len(sys.argv) > 1:
+        # Headless commands: python bidsrec.py record ... / reexport ...
+        from core.cli import main
+        sys.exit(main())
+    from ui.main_window import launch_app
+    launch_app()
@@ -0,0 +1,201 @@
+import glob
+import json
+import os
+import re
+import time
+import cv2
+import h5py
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from core import converter, manifest, metadata, thumbnails
+from core.catalog import get_catalog, DEFAULT_DB_PATH
+
+_SEGMENT = re.compile(r"_split-\d{3}$")
+
+def find_sessions(root):
+    # One entry per recording under root/sub-*/ses-*/<type>/, grouping
+    # rolled-over _split-NNN.avi segments under their common file base.
+    sessions = {}
+    for video in sorted(glob.glob(os.path.join(root, "sub-*", "ses-*", "*", "*.avi"))):
+        type_dir = os.path.dirname(video)
+        ses_dir = os.path.dirname(type_dir)
+        sub_dir = os.path.dirname(ses_dir)
+        base = _SEGMENT.sub("", os.path.splitext(video)[0])
+        session = sessions.setdefault(base, {
+            "subject_id": os.path.basename(sub_dir)[len("sub-"):],
+            "session_id": os.path.basename(ses_dir)[len("ses-"):],
+            "task_type": os.path.basename(type_dir),
+            "file_base": base,
+            "videos": [],
+        })
+        session["videos"].append(video)
+    return list(sessions.values())
+
+def has_video(hdf5_file):
+    # True if the file holds a 'video' dataset. A stream that stored no
+    # frames leaves a file without one.
+    if not os.path.exists(hdf5_file):
+        return False
+    with h5py.File(hdf5_file, 'r') as f:
+        return 'video' in f
+
+def _is_colour(hdf5_file):
+    with h5py.File(hdf5_file, 'r') as f:
+        shape = f['video'].shape
+    return len(shape) == 4 and shape[3] == 3
+
+def _has_channel_outputs(file_base, channels):
+    if channels == "hdf5":
+        with h5py.File(file_base + ".h5", 'r') as f:
+            return all(name in f for name, _ in converter.CHANNELS)
+    channel_dir = file_base + "_channels"
+    return os.path.isdir(channel_dir) and bool(os.listdir(channel_dir))
+
+def _avi_to_hdf5(videos, hdf5_file, codec, chunks):
+    # Written to a .partial file and renamed at the end, so an interrupted
+    # run leaves nothing that a later run would mistake for finished output.
+    partial = hdf5_file + ".partial"
+    fps = None
+    frame = None
+    with converter.HDF5FrameWriter(partial, codec=codec, chunks=chunks) as writer:
+        for video in videos:
+            cap = cv2.VideoCapture(video)
+            if not cap.isOpened():
+                raise RuntimeError(f"Cannot open video file: {video}")
+            fps = fps or cap.get(cv2.CAP_PROP_FPS) or None
+            try:
+                while True:
+                    ret, frame = cap.read(image=frame)
+                    if not ret:
+                        break
+                    writer.append(frame)
+            finally:
+                cap.release()
+        writer.fps = fps
+    if writer.frame_count == 0:
+        os.remove(partial)
+    else:
+        os.replace(partial, hdf5_file)
+    return writer.frame_count, fps
+
+def reexport_session(session, codec="gzip", chunks=None, channels=None, force=False):
+    # Regenerates whatever is missing: the HDF5 stack, its thumbnail
+    # pyramid, the channel export (None, "jpeg" or "hdf5") and the metadata
+    # JSON; force regenerates all but the HDF5 stack. The stack is only
+    # decoded from the AVI when there is none, since one written during
+    # capture is lossless, keeps the preprocessed frame shape and carries the
+    # per-frame tables. Returns a summary dict; "catalog_row" is set when the
+    # session had no metadata yet and so needs a catalog entry, and
+    # "frame_count" whenever the metadata was rewritten.
+    file_base = session["file_base"]
+    videos = session["videos"]
+    hdf5_file = file_base + ".h5"
+    meta_file = file_base + "_metadata.json"
+    result = {"file_base": file_base, "steps": [], "catalog_row": None, "frame_count": None}
+    started = time.monotonic()
+
+    frame_count = fps = None
+    if not has_video(hdf5_file):
+        frame_count, fps = _avi_to_hdf5(videos, hdf5_file, codec, chunks)
+        if frame_count == 0:
+            # Nothing was recorded, so there is nothing to export either.
+            result["seconds"] = time.monotonic() - started
+            return result
+        result["steps"].append("hdf5")
+
+    # Grayscale and single-channel recordings have no colour channels to split.
+    if (channels and _is_colour(hdf5_file)
+            and (result["steps"] or force or not _has_channel_outputs(file_base, channels))):
+        if channels == "hdf5":
+            converter.save_channels_to_hdf5(hdf5_file)
+        else:
+            converter.split_and_save_channels(converter.iter_hdf5_frames(hdf5_file), file_base + "_channels", workers=1)
+        result["steps"].append("channels")
+
+    # Recordings made before the pyramid existed get one added in place.
+    if "hdf5" not in result["steps"] and (force or not thumbnails.has_pyramid(hdf5_file)):
+        thumbnails.build_pyramid(hdf5_file)
+        result["steps"].append("pyramid")
+
+    if result["steps"] or not os.path.exists(meta_file):
+        if frame_count is None:
+            with h5py.File(hdf5_file, 'r') as f:
+                frame_count = int(f['video'].shape[0])
+        if os.path.exists(meta_file):
+            with open(meta_file) as f:
+                meta = json.load(f)
+            meta["frame_count"] = frame_count
+        else:
+            meta = metadata.generate_metadata(session["subject_id"], session["session_id"], frame_count,
+                                              {"fps": fps} if fps else {})
+            result["catalog_row"] = (session["subject_id"], session["session_id"], meta["timestamp"],
+                                     frame_count, file_base, session["task_type"])
+        meta["reexport"] = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "sources": [os.path.basename(video) for video in videos],
+            "steps": result["steps"],
+            "hdf5_codec": codec,
+        }
+        metadata.save_metadata_to_json(meta, meta_file)
+        result["steps"].append("metadata")
+        result["frame_count"] = frame_count
+
+    result["seconds"] = time.monotonic() - started
+    return result
+
+def _frame_count_updates(catalog, session, frame_count):
+    # (frame_count, id) for the session's catalog rows that disagree with
+    # the rewritten metadata. Rows are matched on sub-*/ses-*/<type>/<name>,
+    # as in DatasetManifest.reconcile, since the stored file_base may be
+    # relative or from another mount.
+    key = manifest.bids_key(session["file_base"])
+    updates, cursor = [], None
+    while True:
+        rows, cursor = catalog.query_sessions(subject_id=session["subject_id"], session_id=session["session_id"],
+                                              limit=1000, cursor=cursor)
+        updates.extend((frame_count, row["id"]) for row in rows
+                       if manifest.bids_key(row["file_base"] or "") == key and row["frame_count"] != frame_count)
+        if cursor is None:
+            return updates
+
+def reexport_tree(root, workers=None, codec="gzip", chunks=None, channels=None, force=False,
+                  db_path=DEFAULT_DB_PATH, callback=None):
+    # One session per worker process. Sessions whose outputs are current are
+    # skipped inside the worker, so re-running after an interruption resumes
+    # where the previous run stopped. New catalog rows, and the frame counts
+    # of existing ones whose metadata was rewritten, are written from this
+    # process, so workers never contend for the database.
+    sessions = find_sessions(root)
+    results, errors, rows, recounted = [], [], [], []
+    if not sessions:
+        return results, errors
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=min(workers, len(sessions))) as pool:
+        futures = {
+            pool.submit(reexport_session, session, codec, chunks, channels, force): session
+            for session in sessions
+        }
+        for future in as_completed(futures):
+            session = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                errors.append((session["file_base"], e))
+                if callback:
+                    callback(session["file_base"], None, e)
+                continue
+            results.append(result)
+            if result["catalog_row"]:
+                rows.append(result["catalog_row"])
+            elif result["frame_count"] is not None:
+                recounted.append((session, result["frame_count"]))
+            if callback:
+                callback(session["file_base"], result, None)
+    if rows:
+        get_catalog(db_path).insert_sessions(rows)
+    if recounted:
+        catalog = get_catalog(db_path)
+        updates = [update for session, frame_count in recounted
+                   for update in _frame_count_updates(catalog, session, frame_count)]
+        if updates:
+            catalog.update_frame_counts(updates)
+    return results, errors
@@ -0,0 +1,99 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+import h5py
+from core import camera, converter
+
+SETTINGS_FILE = "recorder_settings.json"
+
+def load_settings(path=SETTINGS_FILE):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def save_settings(settings, path=SETTINGS_FILE):
+    current = load_settings(path)
+    current.update(settings)
+    with open(path, 'w') as f:
+        json.dump(current, f, indent=4)
+    return current
+
+def capture_sample(cap, count=60):
+    return [camera.read_frame(cap) for _ in range(count)]
+
+def benchmark_codecs(frames, codecs=converter.CODECS, chunks=None):
+    raw_bytes = sum(frame.nbytes for frame in frames)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for codec in codecs:
+            path = os.path.join(tmp, f"{codec.replace('+', '_')}.h5")
+            started = time.perf_counter()
+            converter.save_frames_to_hdf5(frames, path, codec=codec, chunks=chunks)
+            write_seconds = time.perf_counter() - started
+
+            started = time.perf_counter()
+            with h5py.File(path, 'r') as f:
+                video = f['video']
+                for i in range(video.shape[0]):
+                    video[i]
+            read_seconds = time.perf_counter() - started
+
+            results.append({
+                "codec": codec,
+                "write_mb_s": raw_bytes / write_seconds / 1e6,
+                "read_mb_s": raw_bytes / read_seconds / 1e6,
+                "ratio": raw_bytes / os.path.getsize(path),
+            })
+    return results
+
+def choose_codec(results, fps, frame_bytes, headroom=1.5):
+    # Among the codecs that write faster than the camera produces data (with
+    # headroom for the rest of the pipeline), keep the best compression; if
+    # none keep up, fall back to whichever writes fastest.
+    required = fps * frame_bytes * headroom / 1e6
+    keeps_up = [r for r in results if r["write_mb_s"] >= required]
+    if keeps_up:
+        return max(keeps_up, key=lambda r: (r["ratio"], r["write_mb_s"]))
+    return max(results, key=lambda r: r["write_mb_s"])
+
+def calibrate(cap, fps, sample_frames=60, chunks=None, settings_path=SETTINGS_FILE):
+    frames = capture_sample(cap, sample_frames)
+    results = benchmark_codecs(frames, chunks=chunks)
+    best = choose_codec(results, fps, frames[0].nbytes)
+    save_settings({
+        "hdf5_codec": best["codec"],
+        "hdf5_chunks": list(chunks) if isinstance(chunks, (list, tuple)) else chunks,
+        "calibrated_fps": fps,
+        "calibrated_resolution": list(frames[0].shape),
+    }, settings_path)
+    return results, best
+
+def format_results(results, best=None):
+    lines = [f"{'codec':<16} {'write MB/s':>10} {'read MB/s':>10} {'ratio':>6}"]
+    for r in results:
+        marker = "  <- selected" if best is not None and r["codec"] == best["codec"] else ""
+        lines.append(f"{r['codec']:<16} {r['write_mb_s']:>10.1f} {r['read_mb_s']:>10.1f} {r['ratio']:>6.2f}{marker}")
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pick the HDF5 codec that keeps up with the camera.")
+    parser.add_argument("--camera", default="0", help="Device index, synthetic spec or replay file")
+    parser.add_argument("--fps", type=float, default=30)
+    parser.add_argument("--frames", type=int, default=60, help="Number of sample frames to compress")
+    parser.add_argument("--chunk-frames", type=int, default=None, help="Frames per HDF5 chunk (default 1)")
+    parser.add_argument("--settings", default=SETTINGS_FILE)
+    args = parser.parse_args(argv)
+
+    cap = camera.initialize_camera(args.camera)
+    try:
+        results, best = calibrate(cap, args.fps, args.frames, args.chunk_frames, args.settings)
+    finally:
+        cap.release()
+    print(format_results(results, best))
+    print(f"Saved '{best['codec']}' to {args.settings}")
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,287 @@
+import json
+import os
+import threading
+import time
 import cv2
+import numpy as np
+from core.instrument import timed
 
-def list_available_cameras(max_index=5):
-    available = []
-    for index in range(max_index):
-        cap = cv2.VideoCapture(index)
-        if cap.read()[0]:
-            available.append(index)
-        cap.release()
-    return available
+SYNTHETIC_PATTERNS = ("gradient", "bars", "checker", "noise")
+
+class SyntheticCamera:
+    # Deterministic stand-in for cv2.VideoCapture: frame i depends only on
+    # (i, pattern, seed), so recordings are reproducible on headless machines.
+    def __init__(self, width=640, height=480, fps=30, pattern="gradient", seed=0, realtime=True):
+        if pattern not in SYNTHETIC_PATTERNS:
+            raise ValueError(f"Unknown synthetic pattern: {pattern}")
+        self.width = int(width)
+        self.height = int(height)
+        self.fps = float(fps)
+        self.pattern = pattern
+        self.seed = seed
+        self.realtime = realtime
+        self.index = 0
+        self.settings = {}
+        self._opened = True
+        self._start = None
+        self._base = self._make_base()
+
+    def _make_base(self):
+        if self.pattern == "gradient":
+            x = np.linspace(0, 255, self.width, dtype=np.float32)
+            y = np.linspace(0, 255, self.height, dtype=np.float32)[:, None]
+            base = np.empty((self.height, self.width, 3), dtype=np.uint8)
+            base[..., 0] = x
+            base[..., 1] = y
+            base[..., 2] = (x + y) / 2
+            return base
+        if self.pattern == "bars":
+            colors = np.array([
+                [255, 255, 255], [0, 255, 255], [255, 255, 0], [0, 255, 0],
+                [255, 0, 255], [0, 0, 255], [255, 0, 0], [0, 0, 0],
+            ], dtype=np.uint8)
+            bar = np.arange(self.width) * len(colors) // self.width
+            return np.broadcast_to(colors[bar], (self.height, self.width, 3)).copy()
+        if self.pattern == "checker":
+            size = max(8, min(self.width, self.height) // 8)
+            yy, xx = np.indices((self.height, self.width))
+            cells = ((yy // size + xx // size) % 2).astype(np.uint8) * 255
+            return np.repeat(cells[..., None], 3, axis=2)
+        return None
+
+    def _render(self, index):
+        if self.pattern == "noise":
+            rng = np.random.default_rng((self.seed, index))
+            return rng.integers(0, 256, (self.height, self.width, 3), dtype=np.uint8)
+        if self.pattern == "checker":
+            return self._base if index % 2 == 0 else 255 - self._base
+        shift = (index * max(1, self.width // 120) + self.seed) % self.width
+        return np.roll(self._base, shift, axis=1)
+
+    def isOpened(self):
+        return self._opened
+
+    def read(self, image=None):
+        if not self._opened:
+            return False, None
+        if self.realtime:
+            if self._start is None:
+                self._start = time.monotonic()
+            delay = self._start + self.index / self.fps - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        frame = self._render(self.index)
+        self.index += 1
+        if image is not None:
+            np.copyto(image, frame)
+            return True, image
+        return True, frame
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.width)
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.height)
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return float(self.index)
+        if prop == cv2.CAP_PROP_POS_MSEC:
+            # Position of the frame read last, as OpenCV reports it.
+            return max(self.index - 1, 0) * 1000.0 / self.fps
+        return self.settings.get(prop, 0.0)
+
+    def set(self, prop, value):
+        self.settings[prop] = value
+        return True
+
+    def getBackendName(self):
+        return "SYNTHETIC"
+
+    def release(self):
+        self._opened = False
+
+def _metadata_fps(hdf5_file):
+    # Recorded frame rate from the _metadata.json next to an .h5 written
+    # before the writer stored video.attrs['fps']; 0 if unknown.
+    try:
+        with open(os.path.splitext(hdf5_file)[0] + "_metadata.json") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return 0
+    return ((meta.get("timing") or {}).get("target_fps") or (meta.get("pipeline") or {}).get("output_fps")
+            or (meta.get("camera_settings") or {}).get("fps") or 0)
+
+class ReplayCamera:
+    # Plays an existing .avi or .h5 recording back as if it were a live
+    # device, paced at the file's frame rate unless realtime is False.
+    def __init__(self, path, fps=None, loop=False, realtime=True):
+        self.path = path
+        self.loop = loop
+        self.realtime = realtime
+        self.index = 0
+        self.settings = {}
+        self._start = None
+        self._played = 0
+        self._capture = None
+        self._file = None
+        ext = os.path.splitext(path)[1].lower()
+        if ext in (".h5", ".hdf5"):
+            import h5py
+            self._file = h5py.File(path, 'r')
+            self._video = self._file['video']
+            self.frame_total = self._video.shape[0]
+            self.height, self.width = self._video.shape[1:3]
+            source_fps = self._video.attrs.get('fps', 0) or _metadata_fps(path)
+        else:
+            self._capture = cv2.VideoCapture(path)
+            if not self._capture.isOpened():
+                raise RuntimeError(f"Cannot open replay file: {path}")
+            self.frame_total = int(self._capture.get(cv2.CAP_PROP_FRAME_COUNT))
+            self.width = int(self._capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+            self.height = int(self._capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            source_fps = self._capture.get(cv2.CAP_PROP_FPS)
+        self.fps = float(fps or source_fps or 30)
+
+    def isOpened(self):
+        return self._capture is not None or self._file is not None
+
+    def _next_frame(self, image=None):
+        if self._file is not None:
+            if self.index >= self.frame_total:
+                if not self.loop or self.frame_total == 0:
+                    return False, None
+                self.index = 0
+            if image is not None:
+                self._video.read_direct(image, np.s_[self.index])
+                return True, image
+            return True, self._video[self.index]
+        ret, frame = self._capture.read(image=image)
+        if not ret and self.loop and self.index > 0:
+            self._capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            self.index = 0
+            ret, frame = self._capture.read(image=image)
+        return ret, frame
 
-def initialize_camera(index=0):
+    def read(self, image=None):
+        if not self.isOpened():
+            return False, None
+        if self.realtime:
+            if self._start is None:
+                self._start = time.monotonic()
+            delay = self._start + self._played / self.fps - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self._played += 1
+        ret, frame = self._next_frame(image)
+        if ret:
+            self.index += 1
+        return ret, frame
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.width)
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.height)
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return float(self.frame_total)
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return float(self.index)
+        if prop == cv2.CAP_PROP_POS_MSEC:
+            # Position of the frame read last, as OpenCV reports it.
+            return max(self.index - 1, 0) * 1000.0 / self.fps
+        return self.settings.get(prop, 0.0)
+
+    def set(self, prop, value):
+        self.settings[prop] = value
+        return True
+
+    def getBackendName(self):
+        return "REPLAY"
+
+    def release(self):
+        if self._capture is not None:
+            self._capture.release()
+            self._capture = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+def parse_synthetic_spec(spec):
+    # "synthetic[:WIDTHxHEIGHT][@FPS][:pattern]", e.g. "synthetic:1280x720@60:bars"
+    options = {}
+    parts = spec.split(":")[1:]
+    for part in parts:
+        if "x" in part and part[0].isdigit():
+            size, _, fps = part.partition("@")
+            width, height = size.split("x")
+            options["width"], options["height"] = int(width), int(height)
+            if fps:
+                options["fps"] = float(fps)
+        elif part.startswith("@"):
+            options["fps"] = float(part[1:])
+        elif part:
+            options["pattern"] = part
+    return options
+
+def probe_camera(index):
     cap = cv2.VideoCapture(index)
+    try:
+        info = {"index": index, "available": bool(cap.isOpened() and cap.read()[0])}
+        if info["available"]:
+            info["backend"] = cap.getBackendName()
+            info["width"] = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+            info["height"] = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            info["fps"] = cap.get(cv2.CAP_PROP_FPS)
+        return info
+    finally:
+        cap.release()
+
+def probe_cameras(indices, timeout=3.0, callback=None):
+    # Opens every device on its own thread so one slow driver cannot hold up
+    # the rest; a device that has not answered within timeout is reported as
+    # timed out. callback, if given, is called from worker threads as each
+    # result becomes known.
+    results = {}
+    lock = threading.Lock()
+
+    def report(info):
+        with lock:
+            if info["index"] in results:
+                return
+            results[info["index"]] = info
+        if callback is not None:
+            callback(info)
+
+    def worker(index):
+        try:
+            report(probe_camera(index))
+        except Exception as e:
+            report({"index": index, "available": False, "error": str(e)})
+
+    threads = [threading.Thread(target=worker, args=(index,), daemon=True) for index in indices]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + timeout
+    for index, thread in zip(indices, threads):
+        thread.join(max(0.0, deadline - time.monotonic()))
+        if thread.is_alive():
+            report({"index": index, "available": False, "timed_out": True})
+    return [results[index] for index in indices]
+
+def list_available_cameras(max_index=5, timeout=3.0):
+    return [info["index"] for info in probe_cameras(list(range(max_index)), timeout) if info["available"]]
+
+def initialize_camera(index=0, **options):
+    # index is a device number, a "synthetic:..." spec, or a path to an
+    # .avi/.h5 recording to replay.
+    if isinstance(index, str) and (index == "synthetic" or index.startswith("synthetic:")):
+        return SyntheticCamera(**{**parse_synthetic_spec(index), **options})
+    if isinstance(index, str) and not index.isdigit():
+        return ReplayCamera(index, **options)
+    cap = cv2.VideoCapture(int(index))
     if not cap.isOpened():
         raise RuntimeError("Cannot open webcam")
     return cap
@@ -25,8 +296,17 @@ def release_camera(cap):
     cap.release()
     cv2.destroyAllWindows()
 
-def read_frame(cap):
-    ret, frame = cap.read()
+@timed("camera.read")
+def read_frame(cap, out=None):
+    # With out, the frame is decoded into that preallocated array instead of
+    # a fresh one. A backend that hands back a different array is copied in.
+    if out is None:
+        ret, frame = cap.read()
+    else:
+        ret, frame = cap.read(image=out)
     if not ret:
         raise RuntimeError("Failed to read frame from camera")
+    if out is not None and frame is not out:
+        np.copyto(out, frame)
+        return out
     return frame
\ No newline at end of file
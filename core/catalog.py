@@ -0,0 +1,309 @@
+import datetime
+import os
+import sqlite3
+import threading
+from core.instrument import timed
+
+DEFAULT_DB_PATH = 'recordings.db'
+
+SESSION_COLUMNS = ("id", "subject_id", "session_id", "timestamp", "frame_count", "file_base", "task_type")
+
+STAGE_METRIC_COLUMNS = ("count", "total_ms", "mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms")
+
+FRAME_STAT_COLUMNS = ("frames", "mean", "std", "p05", "p95", "min_mean", "max_mean", "min", "max")
+
+def _create_sessions(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            subject_id TEXT,
+            session_id TEXT,
+            timestamp TEXT,
+            frame_count INTEGER,
+            file_base TEXT
+        )
+    ''')
+
+def _add_task_type(conn):
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(sessions)")]
+    if "task_type" not in columns:
+        conn.execute("ALTER TABLE sessions ADD COLUMN task_type TEXT")
+    # Older rows only carry the data type as the folder above the file name.
+    rows = conn.execute("SELECT id, file_base FROM sessions WHERE task_type IS NULL").fetchall()
+    conn.executemany(
+        "UPDATE sessions SET task_type = ? WHERE id = ?",
+        [(os.path.basename(os.path.dirname(file_base or "")) or None, row_id) for row_id, file_base in rows],
+    )
+
+def _add_indexes(conn):
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_subject_session ON sessions (subject_id, session_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_timestamp ON sessions (timestamp, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_task_type ON sessions (task_type, timestamp)")
+
+def _add_stage_metrics(conn):
+    # One row per instrumented stage per recorded stream, for trending
+    # timings across sessions and rigs.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS stage_metrics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_row INTEGER REFERENCES sessions (id),
+            rig TEXT,
+            stage TEXT,
+            count INTEGER,
+            total_ms REAL,
+            mean_ms REAL,
+            p50_ms REAL,
+            p95_ms REAL,
+            p99_ms REAL,
+            max_ms REAL
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_stage_metrics_stage ON stage_metrics (stage, rig)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_stage_metrics_session ON stage_metrics (session_row)")
+
+def _add_activity_epochs(conn):
+    # Active epochs of activity-gated recordings, in frames of the stored
+    # video and seconds from the first stored frame.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS activity_epochs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_row INTEGER REFERENCES sessions (id),
+            epoch INTEGER,
+            first_frame INTEGER,
+            last_frame INTEGER,
+            start_s REAL,
+            stop_s REAL,
+            peak_score REAL
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_activity_epochs_session ON activity_epochs (session_row, epoch)")
+
+def _add_frame_stats(conn):
+    # Per-session aggregates of the per-frame statistics: one row per series
+    # (each channel, "brightness" and "motion"), so cross-session searches
+    # never have to open the recordings.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS frame_stats (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_row INTEGER REFERENCES sessions (id),
+            series TEXT,
+            frames INTEGER,
+            mean REAL,
+            std REAL,
+            p05 REAL,
+            p95 REAL,
+            min_mean REAL,
+            max_mean REAL,
+            min REAL,
+            max REAL
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_frame_stats_mean ON frame_stats (series, mean)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_frame_stats_max_mean ON frame_stats (series, max_mean)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_frame_stats_session ON frame_stats (session_row)")
+
+# Applied in order; PRAGMA user_version records how many have run.
+MIGRATIONS = [
+    _create_sessions,
+    _add_task_type,
+    _add_indexes,
+    _add_stage_metrics,
+    _add_activity_epochs,
+    _add_frame_stats,
+]
+
+def migrate(conn):
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        with conn:
+            migration(conn)
+            conn.execute(f"PRAGMA user_version = {number}")
+    return len(MIGRATIONS)
+
+def connect(db_path=DEFAULT_DB_PATH):
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    migrate(conn)
+    return conn
+
+def _end_bound(end):
+    # A bare date means "up to the end of that day".
+    if len(end) == 10:
+        return (datetime.date.fromisoformat(end) + datetime.timedelta(days=1)).isoformat(), "<"
+    return end, "<="
+
+class Catalog:
+    # One long-lived WAL connection per database file, shared by the GUI and
+    # background stages. Access is serialized with a lock.
+    def __init__(self, db_path=DEFAULT_DB_PATH):
+        self.db_path = db_path
+        self.conn = connect(db_path)
+        self.conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+
+    @timed("database.insert")
+    def insert_session(self, subject_id, session_id, timestamp, frame_count, file_base, task_type=None):
+        # Returns the new row's id.
+        with self._lock, self.conn:
+            cursor = self.conn.execute('''
+                INSERT INTO sessions (subject_id, session_id, timestamp, frame_count, file_base, task_type)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (subject_id, session_id, timestamp, frame_count, file_base, task_type))
+        return cursor.lastrowid
+
+    @timed("database.insert")
+    def insert_sessions(self, rows):
+        # All rows go in one transaction.
+        with self._lock, self.conn:
+            self.conn.executemany('''
+                INSERT INTO sessions (subject_id, session_id, timestamp, frame_count, file_base, task_type)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', rows)
+        return len(rows)
+
+    def update_frame_counts(self, rows):
+        # rows of (frame_count, session row id), in one transaction.
+        with self._lock, self.conn:
+            self.conn.executemany("UPDATE sessions SET frame_count = ? WHERE id = ?", rows)
+        return len(rows)
+
+    def insert_stage_metrics(self, session_row, rig, summary):
+        # summary is Metrics.summary(): {stage: {"count": ..., "p95_ms": ...}}.
+        rows = [
+            (session_row, rig, stage) + tuple(values.get(column) for column in STAGE_METRIC_COLUMNS)
+            for stage, values in summary.items() if values.get("count")
+        ]
+        with self._lock, self.conn:
+            self.conn.executemany(f'''
+                INSERT INTO stage_metrics (session_row, rig, stage, {', '.join(STAGE_METRIC_COLUMNS)})
+                VALUES (?, ?, ?{', ?' * len(STAGE_METRIC_COLUMNS)})
+            ''', rows)
+        return len(rows)
+
+    def insert_activity_epochs(self, session_row, epochs):
+        # epochs: rows of (first_frame, last_frame, start_s, stop_s, peak_score).
+        rows = [
+            (session_row, number, int(first), int(last), float(start), float(stop), float(peak))
+            for number, (first, last, start, stop, peak) in enumerate(epochs)
+        ]
+        with self._lock, self.conn:
+            self.conn.executemany('''
+                INSERT INTO activity_epochs (session_row, epoch, first_frame, last_frame, start_s, stop_s, peak_score)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+        return len(rows)
+
+    def query_activity_epochs(self, session_row):
+        with self._lock:
+            return [dict(row) for row in self.conn.execute(
+                "SELECT epoch, first_frame, last_frame, start_s, stop_s, peak_score FROM activity_epochs "
+                "WHERE session_row = ? ORDER BY epoch", (session_row,))]
+
+    def insert_frame_stats(self, session_row, summary):
+        # summary is FrameStats.summary(): {series: {"mean": ..., "max": ...}}.
+        rows = [
+            (session_row, series) + tuple(values.get(column) for column in FRAME_STAT_COLUMNS)
+            for series, values in summary.items()
+        ]
+        with self._lock, self.conn:
+            self.conn.executemany(f'''
+                INSERT INTO frame_stats (session_row, series, {', '.join(FRAME_STAT_COLUMNS)})
+                VALUES (?, ?{', ?' * len(FRAME_STAT_COLUMNS)})
+            ''', rows)
+        return len(rows)
+
+    def query_frame_stats(self, series, column="mean", low=None, high=None, limit=100):
+        # Sessions whose `column` aggregate of `series` lies in [low, high],
+        # e.g. ("brightness", "mean", high=20) for dark sessions or
+        # ("red", "max_mean", low=200) for red spikes. Runs on the
+        # (series, mean) / (series, max_mean) indexes.
+        if column not in FRAME_STAT_COLUMNS:
+            raise ValueError(f"Unknown frame stat column: {column}")
+        clauses, params = ["f.series = ?"], [series]
+        if low is not None:
+            clauses.append(f"f.{column} >= ?")
+            params.append(low)
+        if high is not None:
+            clauses.append(f"f.{column} <= ?")
+            params.append(high)
+        sql = f'''
+            SELECT s.id, s.subject_id, s.session_id, s.timestamp, s.file_base, s.task_type, f.series,
+                   {', '.join('f.' + name for name in FRAME_STAT_COLUMNS)}
+            FROM frame_stats f JOIN sessions s ON s.id = f.session_row
+            WHERE {' AND '.join(clauses)} ORDER BY f.{column} DESC LIMIT ?
+        '''
+        with self._lock:
+            return [dict(row) for row in self.conn.execute(sql, params + [limit])]
+
+    def query_stage_metrics(self, stage=None, rig=None, limit=100):
+        # Newest first, joined with the session each row belongs to.
+        clauses, params = [], []
+        if stage:
+            clauses.append("m.stage = ?")
+            params.append(stage)
+        if rig:
+            clauses.append("m.rig = ?")
+            params.append(rig)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        sql = f'''
+            SELECT s.subject_id, s.session_id, s.timestamp, s.file_base, m.rig, m.stage,
+                   {', '.join('m.' + column for column in STAGE_METRIC_COLUMNS)}
+            FROM stage_metrics m JOIN sessions s ON s.id = m.session_row
+            {where} ORDER BY m.id DESC LIMIT ?
+        '''
+        with self._lock:
+            return [dict(row) for row in self.conn.execute(sql, params + [limit])]
+
+    def query_sessions(self, subject_id=None, session_id=None, start=None, end=None, task_type=None,
+                       limit=50, cursor=None):
+        # Keyset pagination, newest first: pass the returned cursor back in to
+        # get the next page. Each page is a single indexed range scan, however
+        # deep into the history it is.
+        clauses, params = [], []
+        if subject_id:
+            clauses.append("subject_id = ?")
+            params.append(subject_id)
+        if session_id:
+            clauses.append("session_id = ?")
+            params.append(session_id)
+        if task_type:
+            clauses.append("task_type = ?")
+            params.append(task_type)
+        if start:
+            clauses.append("timestamp >= ?")
+            params.append(start)
+        if end:
+            bound, op = _end_bound(end)
+            clauses.append(f"timestamp {op} ?")
+            params.append(bound)
+        if cursor is not None:
+            clauses.append("(timestamp < ? OR (timestamp = ? AND id < ?))")
+            params.extend([cursor[0], cursor[0], cursor[1]])
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        sql = f"SELECT {', '.join(SESSION_COLUMNS)} FROM sessions {where} ORDER BY timestamp DESC, id DESC LIMIT ?"
+        with self._lock:
+            rows = [dict(row) for row in self.conn.execute(sql, params + [limit + 1])]
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = (rows[-1]["timestamp"], rows[-1]["id"])
+        return rows, next_cursor
+
+    def count_sessions(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+def get_catalog(db_path=DEFAULT_DB_PATH):
+    key = os.path.abspath(db_path)
+    with _catalogs_lock:
+        if key not in _catalogs:
+            _catalogs[key] = Catalog(db_path)
+        return _catalogs[key]
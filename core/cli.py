@@ -0,0 +1,284 @@
+import argparse
+import glob
+import json
+import os
+import signal
+import sys
+import time
+import cv2
+from core import camera, calibration, batch, recording, thumbnails
+from core.preprocess import CHANNEL_MODES as PREPROCESS_CHANNELS, parse_roi
+from core.gating import ActivityGate
+from core.catalog import get_catalog, DEFAULT_DB_PATH
+from core.manifest import DatasetManifest
+from core.encoder import FOURCCS
+from core.multicam import MultiCameraRecorder
+from core.pipeline import POLICIES, BLOCK
+
+CHANNEL_MODES = ("none", "jpeg", "hdf5")
+
+RECORD_DEFAULTS = {
+    "camera": ["0"],
+    "fps": 30,
+    "frames": 100,
+    "gain": 128,
+    "exposure": None,
+    "task_type": "func",
+    "label": "video",
+    "output": ".",
+    "policy": BLOCK,
+    "video_codec": "XVID",
+    "segment_frames": None,
+    "channels": "none",
+    "raw": False,
+    "profile": False,
+    "roi": None,
+    "binning": 1,
+    "channel": "all",
+    "average": 1,
+    "gate": None,
+    "gate_release": None,
+    "gate_pre": 0.5,
+    "gate_post": 1.0,
+}
+
+def load_config(path):
+    # A JSON object using the same keys as RECORD_DEFAULTS (plus subject and
+    # session); values given on the command line take precedence.
+    if not path:
+        return {}
+    with open(path) as f:
+        config = json.load(f)
+    unknown = set(config) - set(RECORD_DEFAULTS) - {"subject", "session"}
+    if unknown:
+        raise ValueError(f"Unknown config keys: {', '.join(sorted(unknown))}")
+    return config
+
+def stream_label(source):
+    if source.isdigit():
+        return f"cam{source}"
+    return "synthetic" if source.startswith("synthetic") else os.path.splitext(os.path.basename(source))[0]
+
+def record(options, log=print):
+    # Headless counterpart of the GUI's Start Recording: same pipeline stages
+    # and outputs, minus the preview window. Ctrl+C stops early and keeps
+    # what was captured.
+    subject_id, session_id, task_type = options["subject"], options["session"], options["task_type"]
+    fps = options["fps"]
+    bids_path = os.path.join(options["output"], f"sub-{subject_id}", f"ses-{session_id}", task_type)
+    os.makedirs(bids_path, exist_ok=True)
+    file_base = os.path.join(bids_path, options["label"])
+    settings = calibration.load_settings()
+
+    caps = {}
+    try:
+        for source in options["camera"]:
+            cap = camera.initialize_camera(source)
+            label = stream_label(source)
+            if label in caps:
+                label = f"{label}{len(caps)}"
+            caps[label] = cap
+            camera.set_camera_settings(cap, options["gain"], options["exposure"])
+        multi = len(caps) > 1
+        preprocess = {key: options[key] for key in ("roi", "binning", "channel", "average")}
+        gate = None
+        if options["gate"] is not None:
+            gate = ActivityGate.options(options["gate"], fps / max(1, options["average"]), options["gate_pre"],
+                                        options["gate_post"], options["gate_release"])
+        recorder = MultiCameraRecorder(caps, options["frames"], fps, policy=options["policy"],
+                                       profile=options["profile"] or settings.get("profile", False),
+                                       preprocess=preprocess, gate=gate)
+        encoders = {}
+        for label, pipeline in recorder.pipelines.items():
+            stream_base = recording.stream_file_base(file_base, label, multi)
+            encoders[label], _ = recording.add_storage_stages(
+                pipeline, stream_base + ".avi", stream_base + ".h5", pipeline.output_fps,
+                codec=settings.get("hdf5_codec", "gzip"), chunks=settings.get("hdf5_chunks"),
+                fourcc=options["video_codec"], segment_frames=options["segment_frames"],
+                raw_file=stream_base + ".npy" if options["raw"] else None,
+            )
+
+        previous = signal.signal(signal.SIGINT, lambda signum, frame: recorder.stop())
+        try:
+            log(f"Recording {options['frames']} frames at {fps} fps to {file_base}* (Ctrl+C to stop)")
+            recorder.start()
+            # Poll rather than block in join(), so the SIGINT handler gets to run.
+            while recorder.is_alive():
+                time.sleep(0.1)
+            recorder.join()
+        finally:
+            signal.signal(signal.SIGINT, previous)
+    finally:
+        for cap in caps.values():
+            cap.release()
+
+    extra_metadata = {}
+    if multi:
+        extra_metadata["sync_table"] = os.path.basename(recorder.write_sync_table(file_base + "_sync.tsv"))
+        extra_metadata["streams"] = recorder.labels
+    channels = None if options["channels"] == "none" else options["channels"]
+    for label, pipeline in recorder.pipelines.items():
+        if pipeline.frame_count == 0:
+            log(f"[{label}] no frames recorded")
+            continue
+        stream_base = recording.stream_file_base(file_base, label, multi)
+        stream_metadata = dict(extra_metadata, camera=label) if multi else dict(extra_metadata)
+        stream_metadata["video"] = {
+            "codec": encoders[label].fourcc,
+            "files": [os.path.basename(path) for path in encoders[label].files],
+        }
+        recording.finalize_stream(
+            stream_base, subject_id, session_id, task_type, pipeline.frame_count,
+            {"gain": options["gain"], "exposure": options["exposure"], "fps": fps}, pipeline,
+            channels=channels, db_path=settings.get("db_path", DEFAULT_DB_PATH), extra_metadata=stream_metadata,
+        )
+        log(f"[{label}] {pipeline.frame_count} frames -> {stream_base}*")
+    return file_base
+
+def reexport(args, log=print):
+    def report(file_base, result, error):
+        if error is not None:
+            log(f"FAILED  {file_base}: {error}")
+        elif result["steps"]:
+            log(f"done    {file_base} ({', '.join(result['steps'])}; {result['seconds']:.1f}s)")
+        else:
+            log(f"current {file_base}")
+
+    db_path = args.db or calibration.load_settings().get("db_path", DEFAULT_DB_PATH)
+    channels = None if args.channels == "none" else args.channels
+    results, errors = batch.reexport_tree(
+        args.root, workers=args.workers, codec=args.codec, chunks=args.chunk_frames,
+        channels=channels, force=args.force, db_path=db_path, callback=report,
+    )
+    updated = sum(1 for result in results if result["steps"])
+    log(f"{len(results) + len(errors)} sessions: {updated} updated, {len(results) - updated} current, {len(errors)} failed")
+    return 1 if errors else 0
+
+def timelines(args, log=print):
+    # Writes <file_base>_timeline.png keyframe grids for QC, from the
+    # thumbnail strip where the recording has one.
+    if os.path.isfile(args.path):
+        files = [args.path]
+    else:
+        files = sorted(glob.glob(os.path.join(args.path, "sub-*", "ses-*", "*", "*.h5")))
+    for hdf5_file in files:
+        image, index, _ = thumbnails.timeline_image(hdf5_file, width=args.width, rows=args.rows)
+        if image is None:
+            log(f"empty   {hdf5_file}")
+            continue
+        output = os.path.splitext(hdf5_file)[0] + "_timeline.png"
+        cv2.imwrite(output, image)
+        source = "" if thumbnails.has_pyramid(hdf5_file) else ", sampled from video: no pyramid"
+        log(f"done    {output} ({len(index)} keyframes{source})")
+    return 0
+
+def manifest(args, log=print):
+    # Updates the cached dataset index, rewrites participants.tsv and the
+    # per-subject sessions tables, and reports how the catalog differs.
+    index = DatasetManifest(args.root).scan(full=args.full)
+    index.save()
+    stats = index.stats
+    log(f"{len(index.recordings)} recordings in {stats['folders']} folders "
+        f"({stats['listed']} listed, {stats['cached']} cached, {stats['parsed']} metadata files read)")
+    for path in index.write_tables():
+        log(f"wrote   {path}")
+    db_path = args.db or calibration.load_settings().get("db_path", DEFAULT_DB_PATH)
+    if not os.path.exists(db_path):
+        log(f"No catalog at {db_path}; skipped reconciliation")
+        return 0
+    report = index.reconcile(get_catalog(db_path), fix=args.fix)
+    log(f"catalog: {report['matched']} matched")
+    for key in ("missing_in_catalog", "missing_on_disk", "frame_count_mismatch", "duplicates"):
+        for item in report[key]:
+            log(f"{key}: {item}")
+    if args.fix and report["missing_in_catalog"]:
+        log(f"added {len(report['missing_in_catalog'])} sessions to {db_path}")
+    return 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="bidsrec.py", description="Record and convert BIDS webcam sessions. Run without arguments for the GUI.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rec = commands.add_parser("record", help="Record a session without the GUI")
+    rec.add_argument("--config", help="JSON file with recording options")
+    rec.add_argument("--subject")
+    rec.add_argument("--session")
+    rec.add_argument("--camera", action="append", help="Device index, synthetic spec or replay file; repeat for several cameras")
+    rec.add_argument("--fps", type=int)
+    rec.add_argument("--frames", type=int)
+    rec.add_argument("--gain", type=float)
+    rec.add_argument("--exposure", type=float)
+    rec.add_argument("--task-type", dest="task_type")
+    rec.add_argument("--label", help="File name base (e.g. sub-01_ses-01_task-video)")
+    rec.add_argument("--output", help="BIDS root folder")
+    rec.add_argument("--policy", choices=POLICIES)
+    rec.add_argument("--video-codec", dest="video_codec", choices=list(FOURCCS))
+    rec.add_argument("--segment-frames", dest="segment_frames", type=int)
+    rec.add_argument("--channels", choices=CHANNEL_MODES)
+    rec.add_argument("--raw", action="store_true", default=None, help="Also write a memory-mappable .npy copy")
+    rec.add_argument("--profile", action="store_true", default=None, help="Run cProfile on the capture and stage threads")
+    rec.add_argument("--roi", type=parse_roi, help="Crop to x,y,w,h before storing")
+    rec.add_argument("--bin", dest="binning", type=int, help="Average NxN pixel blocks")
+    rec.add_argument("--channel", choices=PREPROCESS_CHANNELS, help="Keep one colour channel or convert to grayscale")
+    rec.add_argument("--average", type=int, help="Average every N frames (records at fps / N)")
+    rec.add_argument("--gate", type=float, help="Only store frames while the frame-difference score (0-255) reaches this")
+    rec.add_argument("--gate-release", dest="gate_release", type=float, help="Score below which the gate starts closing (default: half of --gate)")
+    rec.add_argument("--gate-pre", dest="gate_pre", type=float, help="Seconds kept before activity starts")
+    rec.add_argument("--gate-post", dest="gate_post", type=float, help="Seconds kept after activity stops")
+
+    exp = commands.add_parser("reexport", help="Regenerate HDF5, channels and metadata from the AVI files in a BIDS tree")
+    exp.add_argument("root", help="BIDS root folder containing sub-*/ses-*/<type>/")
+    exp.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    exp.add_argument("--codec", default="gzip")
+    exp.add_argument("--chunk-frames", type=int, default=None)
+    exp.add_argument("--channels", choices=CHANNEL_MODES, default="none")
+    exp.add_argument("--force", action="store_true", help="Regenerate the pyramid, channels and metadata even if present")
+    exp.add_argument("--db", default=None, help="Catalog database (default: from recorder settings)")
+
+    tl = commands.add_parser("timeline", help="Save keyframe timeline images of recorded HDF5 files")
+    tl.add_argument("path", help="An .h5 file or a BIDS root folder")
+    tl.add_argument("--width", type=int, default=1280, help="Image width in pixels")
+    tl.add_argument("--rows", type=int, default=4, help="Rows of keyframes")
+
+    man = commands.add_parser("manifest", help="Index a BIDS tree, write participants/sessions tables and check the catalog")
+    man.add_argument("root", help="BIDS root folder")
+    man.add_argument("--full", action="store_true", help="Ignore the cache and rescan every folder")
+    man.add_argument("--fix", action="store_true", help="Add recordings missing from the catalog")
+    man.add_argument("--db", default=None, help="Catalog database (default: from recorder settings)")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command == "reexport":
+        return reexport(args)
+    if args.command == "timeline":
+        return timelines(args)
+    if args.command == "manifest":
+        return manifest(args)
+    options = dict(RECORD_DEFAULTS)
+    try:
+        options.update(load_config(args.config))
+    except (OSError, ValueError) as e:
+        print(f"Config error: {e}", file=sys.stderr)
+        return 2
+    options.update({key: value for key, value in vars(args).items()
+                    if key in RECORD_DEFAULTS and value is not None})
+    options["subject"] = args.subject or options.get("subject")
+    options["session"] = args.session or options.get("session")
+    if not options["subject"] or not options["session"]:
+        print("Subject and session are required (--subject/--session or in --config)", file=sys.stderr)
+        return 2
+    if isinstance(options["camera"], (str, int)):
+        options["camera"] = [options["camera"]]
+    options["camera"] = [str(source) for source in options["camera"]]
+    try:
+        if isinstance(options["roi"], str):
+            options["roi"] = parse_roi(options["roi"])
+        record(options)
+    except ValueError as e:
+        print(f"Option error: {e}", file=sys.stderr)
+        return 2
+    except RuntimeError as e:
+        print(f"Recording error: {e}", file=sys.stderr)
+        return 1
+    return 0
@@ -2,30 +2,366 @@ import h5py
 import numpy as np
 import cv2
 import os
-import threading
+from core.reader import HDF5FrameReader
+from core import rawstore, thumbnails
+from core.instrument import timed
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
 
-def save_frames_to_hdf5(frames, filename):
-    with h5py.File(filename, 'w') as f:
-        f.create_dataset('video', data=np.array(frames), compression="gzip")
+CODECS = (
+    "none", "lzf", "lzf+shuffle",
+    "gzip-1", "gzip-1+shuffle", "gzip-4", "gzip-4+shuffle", "gzip-6", "gzip-9",
+)
 
-def split_and_save_channels(frames, base_path):
-    os.makedirs(base_path, exist_ok=True)
+def codec_options(codec):
+    # "none", "lzf" or "gzip[-level]", optionally suffixed with "+shuffle".
+    name, _, flag = (codec or "none").partition("+")
+    if flag not in ("", "shuffle"):
+        raise ValueError(f"Unknown codec filter: {flag}")
+    options = {"compression": None, "compression_opts": None, "shuffle": flag == "shuffle"}
+    if name == "lzf":
+        options["compression"] = "lzf"
+    elif name.startswith("gzip"):
+        level = name.partition("-")[2]
+        options["compression"] = "gzip"
+        options["compression_opts"] = int(level) if level else 4
+    elif name != "none":
+        raise ValueError(f"Unknown codec: {codec}")
+    return options
+
+def chunk_shape(frame_shape, chunks=None):
+    # chunks may be None (one frame per chunk), a frame count, or a full
+    # chunk shape such as (1, 240, 320, 3) for spatial tiling.
+    if chunks is None:
+        return (1,) + tuple(frame_shape)
+    if isinstance(chunks, int):
+        return (chunks,) + tuple(frame_shape)
+    chunks = tuple(int(c) for c in chunks)
+    if len(chunks) != len(frame_shape) + 1:
+        raise ValueError(f"Chunk shape {chunks} does not match frame shape {tuple(frame_shape)}")
+    return chunks
+
+class HDF5FrameWriter:
+    # pyramid lists the downsampling factors stored under 'pyramid' next to
+    # 'video' (see core/thumbnails.py); None or () writes 'video' only. fps,
+    # if known (it may also be set before close), is saved as video.attrs['fps'].
+    def __init__(self, filename, batch_size=8, codec="gzip", chunks=None,
+                 pyramid=thumbnails.PYRAMID_FACTORS, keyframe_interval=thumbnails.KEYFRAME_INTERVAL, fps=None):
+        self.filename = filename
+        self.fps = fps
+        self.batch_size = max(1, int(batch_size))
+        self.codec = codec
+        self.chunks = chunks
+        self.pyramid = tuple(pyramid or ())
+        self.keyframe_interval = keyframe_interval
+        self._codec_options = codec_options(codec)
+        self.frame_count = 0
+        self._file = h5py.File(filename, 'w')
+        self._dataset = None
+        self._pyramid = None
+        self._timestamps = None
+        self._batch = None
+        self._batch_times = None
+        self._pending = 0
+
+    def _create_dataset(self, frame):
+        # By default one chunk per frame, so every append is compressed as it
+        # arrives and close() only has to flush the last partial batch.
+        self._dataset = self._file.create_dataset(
+            'video',
+            shape=(0,) + frame.shape,
+            maxshape=(None,) + frame.shape,
+            dtype=frame.dtype,
+            chunks=chunk_shape(frame.shape, self.chunks),
+            **self._codec_options,
+        )
+        self._dataset.attrs['codec'] = self.codec or "none"
+        # Frames are copied into one reusable batch buffer, so callers may
+        # reuse their frame arrays (e.g. ring-buffer slots) straight away.
+        self._batch = np.empty((self.batch_size,) + frame.shape, dtype=frame.dtype)
+        if self.pyramid:
+            self._pyramid = thumbnails.PyramidBuilder(self._file, frame.shape, frame.dtype, self.pyramid,
+                                                      self.keyframe_interval, batch_size=self.batch_size,
+                                                      **self._codec_options)
+
+    def _create_timestamps(self):
+        width = len(rawstore.TIMESTAMP_COLUMNS)
+        self._timestamps = self._file.create_dataset(
+            'timestamps',
+            shape=(0, width),
+            maxshape=(None, width),
+            dtype='f8',
+            chunks=(1024, width),
+        )
+        self._timestamps.attrs['columns'] = list(rawstore.TIMESTAMP_COLUMNS)
+        self._batch_times = np.full((self.batch_size, width), np.nan)
+
+    def append(self, frame, timestamp=None):
+        # timestamp is an optional (monotonic seconds, CAP_PROP_POS_MSEC
+        # [, frame index]) tuple stored row-for-row with the frame in the
+        # 'timestamps' dataset; missing values are NaN.
+        if self._dataset is None:
+            self._create_dataset(frame)
+            if timestamp is not None:
+                self._create_timestamps()
+        self._batch[self._pending] = frame
+        if self._timestamps is not None:
+            row = self._batch_times[self._pending]
+            row[:] = np.nan
+            if timestamp is not None:
+                row[:len(timestamp)] = timestamp
+        self._pending += 1
+        if self._pending >= self.batch_size:
+            self.flush()
+
+    def extend(self, frames):
+        for frame in frames:
+            self.append(frame)
+
+    @timed("converter.hdf5_flush")
+    def flush(self):
+        if not self._pending:
+            return
+        start = self.frame_count
+        end = start + self._pending
+        self._dataset.resize(end, axis=0)
+        self._dataset[start:end] = self._batch[:self._pending]
+        if self._pyramid is not None:
+            self._pyramid.extend(self._batch[:self._pending])
+        if self._timestamps is not None:
+            self._timestamps.resize(end, axis=0)
+            self._timestamps[start:end] = self._batch_times[:self._pending]
+        self.frame_count = end
+        self._pending = 0
+
+    def close(self):
+        if self._file is None:
+            return
+        self.flush()
+        if self._dataset is not None and self.fps:
+            self._dataset.attrs['fps'] = float(self.fps)
+        self._file.close()
+        self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+def save_frames_to_hdf5(frames, filename, codec="gzip", chunks=None):
+    with HDF5FrameWriter(filename, codec=codec, chunks=chunks) as writer:
+        writer.extend(frames)
+
+def raw_to_hdf5(raw_file, hdf5_file, codec="gzip", chunks=None, batch_size=64):
+    # Block copy from the memory-mapped raw file; each slice goes straight to
+    # h5py without an intermediate per-frame buffer.
+    frames, info = rawstore.load_raw(raw_file)
+    timestamps = rawstore.raw_timestamps(info)
+    with h5py.File(hdf5_file, 'w') as f:
+        video = f.create_dataset(
+            'video',
+            shape=frames.shape,
+            maxshape=(None,) + frames.shape[1:],
+            dtype=frames.dtype,
+            chunks=chunk_shape(frames.shape[1:], chunks),
+            **codec_options(codec),
+        )
+        video.attrs['codec'] = codec or "none"
+        if info.get("fps"):
+            video.attrs['fps'] = float(info["fps"])
+        for start in range(0, len(frames), batch_size):
+            video[start:start + batch_size] = frames[start:start + batch_size]
+        if len(timestamps) == len(frames) and len(frames):
+            width = timestamps.shape[1]
+            dataset = f.create_dataset('timestamps', data=timestamps, maxshape=(None, width), chunks=(1024, width))
+            dataset.attrs['columns'] = list(rawstore.TIMESTAMP_COLUMNS)
+    return len(frames)
+
+def hdf5_to_raw(hdf5_file, raw_file, fps=None, batch_size=64):
+    # Decodes the 'video' dataset directly into the raw file's memory map.
+    with h5py.File(hdf5_file, 'r') as f:
+        video = f['video']
+        count = video.shape[0]
+        timestamps = f['timestamps'][:count].tolist() if 'timestamps' in f else None
+        frames = rawstore.create_raw(raw_file, count, video.shape[1:], video.dtype, fps=fps, timestamps=timestamps)
+        for start in range(0, count, batch_size):
+            end = min(start + batch_size, count)
+            video.read_direct(frames, np.s_[start:end], np.s_[start:end])
+        if count:
+            frames.flush()
+    return count
+
+def stored_frame_index(hdf5_file):
+    # Recorded frame number of each row of 'video', i.e. the row of the
+    # per-frame tables (frame_stats, stage_latency_ms) that describes it.
+    # The two only differ if the HDF5 stage dropped frames; files without
+    # the column are taken not to have.
+    with h5py.File(hdf5_file, 'r') as f:
+        count = f['video'].shape[0]
+        if 'timestamps' in f and "frame_index" in list(f['timestamps'].attrs.get('columns', [])):
+            column = list(f['timestamps'].attrs['columns']).index("frame_index")
+            index = f['timestamps'][:count, column]
+            if len(index) == count and not np.isnan(index).any():
+                return index.astype(np.int64)
+        return np.arange(count, dtype=np.int64)
+
+def write_frame_table(hdf5_file, name, data, columns):
+    # Stores a per-frame (N, len(columns)) table next to 'video', replacing
+    # any earlier one of the same name.
+    with h5py.File(hdf5_file, 'a') as f:
+        if name in f:
+            del f[name]
+        dataset = f.create_dataset(name, data=data, chunks=True, compression="gzip")
+        dataset.attrs['columns'] = list(columns)
+    return name
+
+def iter_hdf5_frames(hdf5_file):
+    with h5py.File(hdf5_file, 'r') as f:
+        video = f['video']
+        for i in range(video.shape[0]):
+            yield video[i]
+
+CHANNELS = (("red", 2), ("green", 1), ("blue", 0))
+
+def _write_channel_batch(base_path, batch):
+    # Each channel is a strided view into the BGR frame, so no split copies
+    # are made before the JPEG encoder reads it.
+    for i, frame in batch:
+        for name, c in CHANNELS:
+            cv2.imwrite(os.path.join(base_path, f"frame_{i:04d}_{name}.jpg"), frame[:, :, c])
+    return len(batch)
+
+def _iter_batches(frames, batch_size):
+    batch = []
     for i, frame in enumerate(frames):
-        b, g, r = cv2.split(frame)
-        cv2.imwrite(os.path.join(base_path, f"frame_{i:04d}_red.jpg"), r)
-        cv2.imwrite(os.path.join(base_path, f"frame_{i:04d}_green.jpg"), g)
-        cv2.imwrite(os.path.join(base_path, f"frame_{i:04d}_blue.jpg"), b)
-
-def preview_hdf5(hdf5_file, frame_index=0):
-    def show_frame():
-        with h5py.File(hdf5_file, 'r') as f:
-            frames = f['video'][:]
-            if frame_index < len(frames):
-                frame = frames[frame_index]
-                cv2.imshow("HDF5 Preview", frame)
-                cv2.waitKey(0)
-                cv2.destroyAllWindows()
-    threading.Thread(target=show_frame).start()
+        batch.append((i, frame))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+@timed("converter.split_channels")
+def split_and_save_channels(frames, base_path, workers=None, executor="thread", batch_size=32):
+    os.makedirs(base_path, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    if executor == "process":
+        pool = ProcessPoolExecutor(max_workers=workers)
+    elif executor == "thread":
+        pool = ThreadPoolExecutor(max_workers=workers)
+    else:
+        raise ValueError(f"Unknown executor: {executor}")
+    written = 0
+    pending = set()
+    with pool:
+        for batch in _iter_batches(frames, batch_size):
+            # Cap in-flight batches so a long recording is never fully in memory.
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                written += sum(future.result() for future in done)
+            pending.add(pool.submit(_write_channel_batch, base_path, batch))
+        written += sum(future.result() for future in pending)
+    return written
+
+@timed("converter.channels_hdf5")
+def save_channels_to_hdf5(hdf5_file, batch_size=64):
+    # Writes red/green/blue datasets next to 'video' in the session file,
+    # losslessly and without going through JPEG.
+    with h5py.File(hdf5_file, 'a') as f:
+        video = f['video']
+        count, height, width = video.shape[:3]
+        datasets = {}
+        for name, _ in CHANNELS:
+            if name in f:
+                del f[name]
+            datasets[name] = f.create_dataset(
+                name,
+                shape=(count, height, width),
+                dtype=video.dtype,
+                chunks=(1, height, width),
+                compression=video.compression,
+                compression_opts=video.compression_opts,
+                shuffle=video.shuffle,
+            )
+        for start in range(0, count, batch_size):
+            end = min(start + batch_size, count)
+            batch = video[start:end]
+            for name, c in CHANNELS:
+                datasets[name][start:end] = batch[..., c]
+        return count
+
+def preview_hdf5(hdf5_file, after, frame_index=0, scale=None):
+    # Scrubbable viewer: the trackbar only records the requested position and
+    # each poll renders the latest one, so dragging never queues up reads.
+    # With a scale below 1 it reads the smallest pyramid level that is still
+    # that large instead of decoding full-resolution frames. HighGUI is not
+    # thread-safe, so the window is polled from the caller's main loop via
+    # after(ms, callback) (e.g. Tk's root.after); only the reader's chunk
+    # prefetch runs in the background.
+    window = "HDF5 Preview (a/d: step, q: close)"
+    with h5py.File(hdf5_file, 'r') as f:
+        dataset = thumbnails.pick_level(f, scale=scale) if scale else 'video'
+    reader = HDF5FrameReader(hdf5_file, dataset=dataset)
+    total = len(reader)
+    if total == 0:
+        reader.close()
+        return
+    position = {"index": min(max(frame_index, 0), total - 1), "shown": None}
+
+    def close():
+        reader.close()
+        cv2.destroyWindow(window)
+
+    def poll():
+        if cv2.getWindowProperty(window, cv2.WND_PROP_VISIBLE) < 1:
+            close()
+            return
+        if position["index"] != position["shown"]:
+            position["shown"] = position["index"]
+            cv2.imshow(window, reader[position["shown"]])
+        key = cv2.waitKey(1) & 0xFF
+        if key == ord('q'):
+            close()
+            return
+        if key in (ord('a'), ord('d')):
+            step = 1 if key == ord('d') else -1
+            cv2.setTrackbarPos("Frame", window, min(max(position["shown"] + step, 0), total - 1))
+        after(15, poll)
+
+    cv2.namedWindow(window)
+    cv2.createTrackbar("Frame", window, position["index"], max(total - 1, 1),
+                       lambda value: position.update(index=min(value, total - 1)))
+    poll()
+
+def preview_timeline(hdf5_file, after, width=1280, rows=4, scale=None):
+    # Keyframe grid of the whole recording, read from the thumbnail strip;
+    # clicking a keyframe opens preview_hdf5 at that frame. The window is
+    # polled from the caller's main loop via after(ms, callback), as HighGUI
+    # is not thread-safe. Returns False if there is nothing to show.
+    image, index, columns = thumbnails.timeline_image(hdf5_file, width=width, rows=rows)
+    if image is None:
+        return False
+    window = f"Timeline: {os.path.basename(hdf5_file)} (click: open frame, q: close)"
+    tile_h = image.shape[0] // -(-len(index) // columns)
+    tile_w = image.shape[1] // columns
+
+    def on_mouse(event, x, y, flags, param):
+        if event == cv2.EVENT_LBUTTONDOWN:
+            tile = (y // tile_h) * columns + x // tile_w
+            if tile < len(index):
+                preview_hdf5(hdf5_file, after, int(index[tile]), scale=scale)
+
+    def poll():
+        if cv2.getWindowProperty(window, cv2.WND_PROP_VISIBLE) < 1 or cv2.waitKey(1) & 0xFF == ord('q'):
+            cv2.destroyWindow(window)
+            return
+        after(50, poll)
+
+    cv2.namedWindow(window)
+    cv2.setMouseCallback(window, on_mouse)
+    cv2.imshow(window, image)
+    poll()
+    return True
 
 def get_bids_path(output_root, subject_id, session_id):
     bids_root = os.path.join(output_root, f"sub-{subject_id}", f"ses-{session_id}", "func")
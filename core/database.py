@@ -1,25 +1,15 @@
-import sqlite3
+from core.catalog import connect, DEFAULT_DB_PATH
+from core.instrument import timed
 
-def initialize_database(db_path='recordings.db'):
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS sessions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            subject_id TEXT,
-            session_id TEXT,
-            timestamp TEXT,
-            frame_count INTEGER,
-            file_base TEXT
-        )
-    ''')
-    conn.commit()
-    return conn
+def initialize_database(db_path=DEFAULT_DB_PATH):
+    # Schema creation and upgrades live in core.catalog.
+    return connect(db_path)
 
-def insert_session_metadata(conn, subject_id, session_id, timestamp, frame_count, file_base):
+@timed("database.insert")
+def insert_session_metadata(conn, subject_id, session_id, timestamp, frame_count, file_base, task_type=None):
     cursor = conn.cursor()
     cursor.execute('''
-        INSERT INTO sessions (subject_id, session_id, timestamp, frame_count, file_base)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (subject_id, session_id, timestamp, frame_count, file_base))
+        INSERT INTO sessions (subject_id, session_id, timestamp, frame_count, file_base, task_type)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (subject_id, session_id, timestamp, frame_count, file_base, task_type))
     conn.commit()
@@ -0,0 +1,79 @@
+import json
+import os
+import queue
+import threading
+import time
+from core import camera
+
+CACHE_FILE = "camera_cache.json"
+
+def load_cache(path=CACHE_FILE):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_cache(cache, path=CACHE_FILE):
+    with open(path, 'w') as f:
+        json.dump(cache, f, indent=4)
+
+def device_label(info):
+    index = info["index"]
+    if info.get("timed_out"):
+        return f"{index} - (Not Responding)"
+    if not info.get("available"):
+        return f"{index} - (Unavailable)"
+    name = f"{index} - Built-in Camera" if index == 0 else f"{index} - Camera {index}"
+    if "obs" in info.get("backend", "").lower():
+        name += " (OBS VirtualCam)"
+    return name
+
+class CameraDiscovery:
+    # Probes devices in the background and persists what it finds, keyed by
+    # device index, so the next launch can list cameras without opening them.
+    def __init__(self, indices=range(4), timeout=3.0, cache_path=CACHE_FILE):
+        self.indices = list(indices)
+        self.timeout = timeout
+        self.cache_path = cache_path
+        self.cache = load_cache(cache_path)
+        self.results = queue.Queue()
+        self._thread = None
+
+    def cached_devices(self):
+        return [self.cache[str(index)] for index in self.indices if str(index) in self.cache]
+
+    def has_cache(self):
+        return all(str(index) in self.cache for index in self.indices)
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        def on_result(info):
+            # A device that times out keeps its last known entry in the cache.
+            if not info.get("timed_out"):
+                self.cache[str(info["index"])] = dict(info, checked_at=time.time())
+            self.results.put(info)
+
+        camera.probe_cameras(self.indices, self.timeout, callback=on_result)
+        try:
+            save_cache(self.cache, self.cache_path)
+        except OSError:
+            pass
+
+    def poll(self):
+        found = []
+        while True:
+            try:
+                found.append(self.results.get_nowait())
+            except queue.Empty:
+                return found
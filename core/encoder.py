@@ -0,0 +1,58 @@
+import os
+import cv2
+
+# Display name -> fourcc. FFV1 is lossless; XVID and MJPG are lossy.
+FOURCCS = {
+    "XVID": "XVID",
+    "MJPG": "MJPG",
+    "FFV1": "FFV1",
+}
+
+def segment_path(video_file, segment):
+    base, ext = os.path.splitext(video_file)
+    return f"{base}_split-{segment:03d}{ext}"
+
+class VideoEncoder:
+    # Writes frames to an AVI as they arrive. With segment_frames set it
+    # rolls over to a new numbered file (<base>_split-001.avi, ...) every
+    # segment_frames frames, so no single file grows without bound.
+    def __init__(self, video_file, fps, fourcc="XVID", segment_frames=None):
+        if fourcc not in FOURCCS:
+            raise ValueError(f"Unknown video codec: {fourcc}")
+        self.video_file = video_file
+        self.fps = fps
+        self.fourcc = fourcc
+        self.segment_frames = segment_frames or None
+        self.files = []
+        self.frame_count = 0
+        self._writer = None
+        self._segment_count = 0
+
+    def _open(self, frame):
+        if self.segment_frames:
+            path = segment_path(self.video_file, len(self.files) + 1)
+        else:
+            path = self.video_file
+        height, width = frame.shape[:2]
+        is_color = frame.ndim == 3 and frame.shape[2] == 3
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*FOURCCS[self.fourcc]), self.fps, (width, height), is_color)
+        if not writer.isOpened():
+            raise RuntimeError(f"Cannot open video writer for {path} with codec {self.fourcc}")
+        self._writer = writer
+        self._segment_count = 0
+        self.files.append(path)
+
+    def write(self, frame):
+        if self._writer is not None and self.segment_frames and self._segment_count >= self.segment_frames:
+            self._writer.release()
+            self._writer = None
+        if self._writer is None:
+            self._open(frame)
+        self._writer.write(frame)
+        self._segment_count += 1
+        self.frame_count += 1
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.release()
+            self._writer = None
@@ -0,0 +1,112 @@
+import cv2
+import h5py
+import numpy as np
+
+STATS = ("mean", "std", "min", "max")
+_BGR_NAMES = ("blue", "green", "red")
+
+def channel_names(frame_shape):
+    if len(frame_shape) == 2:
+        return ("gray",)
+    if frame_shape[2] == 3:
+        return _BGR_NAMES
+    return tuple(f"c{c}" for c in range(frame_shape[2]))
+
+class FrameStats:
+    # Handler for a storage stage that computes, per recorded frame, the
+    # mean/std/min/max of every channel and a motion energy value (mean
+    # absolute difference from the previous frame, on a 1/motion_scale gray
+    # copy), into a preallocated float32 table indexed by frame number.
+    def __init__(self, capacity, motion_scale=4):
+        self.capacity = int(capacity)
+        self.motion_scale = max(1, int(motion_scale))
+        self.channels = None
+        self.columns = None
+        self.values = None
+        self.count = 0
+        self._small = None
+        self._gray = None
+        self._previous = None
+        self._diff = None
+
+    def _allocate(self, frame):
+        self.channels = channel_names(frame.shape)
+        self.columns = [f"{channel}_{stat}" for stat in STATS for channel in self.channels] + ["motion"]
+        self.values = np.full((self.capacity, len(self.columns)), np.nan, dtype=np.float32)
+
+    def _motion(self, frame):
+        h, w = frame.shape[:2]
+        size = (max(1, w // self.motion_scale), max(1, h // self.motion_scale))
+        self._small = cv2.resize(frame, size, dst=self._small, interpolation=cv2.INTER_AREA)
+        small = self._small
+        if small.ndim == 3:
+            self._gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY, dst=self._gray)
+            small = self._gray
+        if self._previous is None:
+            self._previous = small.copy()
+            self._diff = np.empty_like(small)
+            return 0.0
+        cv2.absdiff(small, self._previous, dst=self._diff)
+        self._previous[...] = small
+        return cv2.mean(self._diff)[0]
+
+    def __call__(self, index, timestamp, frame):
+        if self.values is None:
+            self._allocate(frame)
+        if index >= self.capacity:
+            return
+        n = len(self.channels)
+        row = self.values[index]
+        mean, std = cv2.meanStdDev(frame)
+        row[0:n] = mean[:n, 0]
+        row[n:2 * n] = std[:n, 0]
+        # Reducing over rows first keeps both passes over contiguous memory;
+        # a flat (pixels, channels) reduction is ~50x slower.
+        flat = frame.reshape(frame.shape[0], -1)
+        row[2 * n:3 * n] = flat.min(axis=0).reshape(-1, n).min(axis=0)
+        row[3 * n:4 * n] = flat.max(axis=0).reshape(-1, n).max(axis=0)
+        row[4 * n] = self._motion(frame)
+        self.count = max(self.count, index + 1)
+
+    def table(self, frame_count=None):
+        if self.values is None:
+            return np.empty((0, 0), dtype=np.float32)
+        return self.values[:frame_count if frame_count is not None else self.count]
+
+    def summary(self, frame_count=None):
+        # One aggregate per channel, plus "brightness" (mean over channels)
+        # and "motion": the mean, spread, 5th/95th percentile and extremes
+        # of the per-frame means, and the extreme pixel values seen.
+        table = self.table(frame_count)
+        if table.size == 0:
+            return {}
+        n = len(self.channels)
+        series = {channel: (table[:, c], table[:, 2 * n + c], table[:, 3 * n + c])
+                  for c, channel in enumerate(self.channels)}
+        if n > 1:
+            series["brightness"] = (table[:, :n].mean(axis=1), table[:, 2 * n:3 * n].min(axis=1),
+                                    table[:, 3 * n:4 * n].max(axis=1))
+        motion = table[:, 4 * n]
+        series["motion"] = (motion, motion, motion)
+        summary = {}
+        for name, (means, lows, highs) in series.items():
+            p05, p95 = np.nanpercentile(means, [5, 95])
+            summary[name] = {
+                "frames": int(np.count_nonzero(~np.isnan(means))),
+                "mean": float(np.nanmean(means)),
+                "std": float(np.nanstd(means)),
+                "p05": float(p05),
+                "p95": float(p95),
+                "min_mean": float(np.nanmin(means)),
+                "max_mean": float(np.nanmax(means)),
+                "min": float(np.nanmin(lows)),
+                "max": float(np.nanmax(highs)),
+            }
+        return summary
+
+def load_frame_stats(hdf5_file):
+    # {column: per-frame array} from a recording's 'frame_stats' dataset.
+    with h5py.File(hdf5_file, 'r') as f:
+        dataset = f['frame_stats']
+        values = dataset[()]
+        return {name: values[:, i] for i, name in enumerate(dataset.attrs['columns'])}
@@ -0,0 +1,53 @@
+import threading
+import numpy as np
+
+class RingFrameStore:
+    # A single preallocated (capacity, H, W, C) array that the capture thread
+    # reads into slot by slot. Frame number n always lives in slot
+    # n % capacity; a slot is only reused once every stage it was handed to
+    # has released it, so consumers see stable data without per-frame copies.
+    def __init__(self, capacity):
+        self.capacity = int(capacity)
+        self.frames = None
+        self.monotonic_times = np.zeros(self.capacity, dtype=np.float64)
+        self.device_times = np.zeros(self.capacity, dtype=np.float64)
+        self._refs = [0] * self.capacity
+        self._condition = threading.Condition()
+
+    def allocate(self, frame_shape, dtype=np.uint8):
+        if self.frames is None:
+            self.frames = np.empty((self.capacity,) + tuple(frame_shape), dtype=dtype)
+        return self.frames
+
+    @property
+    def allocated(self):
+        return self.frames is not None
+
+    def slot(self, sequence):
+        return sequence % self.capacity
+
+    def acquire(self, sequence, stop_event=None):
+        # Waits until the slot for this sequence number is free; returns the
+        # slot index, or None if stop_event was set while waiting.
+        slot = self.slot(sequence)
+        with self._condition:
+            while self._refs[slot] > 0:
+                if stop_event is not None and stop_event.is_set():
+                    return None
+                self._condition.wait(0.05)
+        return slot
+
+    def hold(self, slot, count):
+        with self._condition:
+            self._refs[slot] += count
+
+    def release(self, slot):
+        with self._condition:
+            self._refs[slot] -= 1
+            if self._refs[slot] <= 0:
+                self._refs[slot] = 0
+                self._condition.notify_all()
+
+    def stamp(self, slot, monotonic_time, device_time):
+        self.monotonic_times[slot] = monotonic_time
+        self.device_times[slot] = device_time
@@ -0,0 +1,80 @@
+import cv2
+import numpy as np
+
+class ActivityGate:
+    # Decides frame by frame whether a recording is in an active epoch. The
+    # score is the mean absolute difference (0-255) between this frame and
+    # the previous one, both shrunk by `scale` with INTER_AREA and converted
+    # to gray, so it costs a fraction of a millisecond even at high
+    # resolution. The gate opens when the score reaches threshold and closes
+    # once it has stayed below release_threshold for more than post_frames
+    # frames; pre_frames frames from before the opening are kept as well.
+    def __init__(self, threshold=4.0, release_threshold=None, pre_frames=15, post_frames=30, scale=8):
+        self.threshold = float(threshold)
+        self.release_threshold = float(release_threshold if release_threshold is not None else threshold / 2)
+        if self.release_threshold > self.threshold:
+            raise ValueError("release_threshold must not exceed threshold")
+        self.pre_frames = max(0, int(pre_frames))
+        self.post_frames = max(0, int(post_frames))
+        self.scale = max(1, int(scale))
+        self.active = False
+        self._quiet = 0
+        self._small = None
+        self._gray = None
+        self._previous = None
+        self._diff = None
+
+    def score(self, frame):
+        h, w = frame.shape[:2]
+        size = (max(1, w // self.scale), max(1, h // self.scale))
+        if self._small is None:
+            self._small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        else:
+            cv2.resize(frame, size, dst=self._small, interpolation=cv2.INTER_AREA)
+        small = self._small
+        if small.ndim == 3:
+            self._gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY, dst=self._gray)
+            small = self._gray
+        if self._previous is None:
+            self._previous = small.copy()
+            self._diff = np.empty_like(small)
+            return 0.0
+        cv2.absdiff(small, self._previous, dst=self._diff)
+        self._previous[...] = small
+        return float(cv2.mean(self._diff)[0])
+
+    def update(self, score):
+        # Returns (opened, active): opened is True on the frame the gate opens.
+        if not self.active:
+            if score >= self.threshold:
+                self.active = True
+                self._quiet = 0
+                return True, True
+            return False, False
+        if score < self.release_threshold:
+            self._quiet += 1
+            if self._quiet > self.post_frames:
+                self.active = False
+                return False, False
+        else:
+            self._quiet = 0
+        return False, True
+
+    @staticmethod
+    def options(threshold, output_fps, pre_seconds=0.5, post_seconds=1.0, release_threshold=None):
+        # Gate options with padding given in seconds at the recorded frame rate.
+        return {
+            "threshold": threshold,
+            "release_threshold": release_threshold,
+            "pre_frames": int(round(pre_seconds * output_fps)),
+            "post_frames": int(round(post_seconds * output_fps)),
+        }
+
+    def describe(self):
+        return {
+            "threshold": self.threshold,
+            "release_threshold": self.release_threshold,
+            "pre_frames": self.pre_frames,
+            "post_frames": self.post_frames,
+            "scale": self.scale,
+        }
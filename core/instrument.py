@@ -0,0 +1,156 @@
+import cProfile
+import functools
+import io
+import math
+import pstats
+import threading
+import time
+
+# Histogram buckets are quarter-octaves of microseconds (about 19% wide),
+# from 1 us up to ~17 s; anything outside lands in the first or last bucket.
+BUCKETS_PER_OCTAVE = 4
+BUCKET_COUNT = 24 * BUCKETS_PER_OCTAVE + 1
+
+def bucket_upper_ms(bucket):
+    return 2 ** (bucket / BUCKETS_PER_OCTAVE) / 1000.0
+
+class Histogram:
+    # Fixed log-spaced buckets, so adding a sample is O(1) and the memory
+    # use does not grow with the length of the recording.
+    def __init__(self):
+        self.counts = [0] * BUCKET_COUNT
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        us = seconds * 1e6
+        bucket = math.ceil(math.log2(us) * BUCKETS_PER_OCTAVE) if us > 1.0 else 0
+        bucket = min(bucket, BUCKET_COUNT - 1)
+        with self._lock:
+            self.counts[bucket] += 1
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def percentile(self, q):
+        # Upper edge of the bucket holding the q-th percentile sample.
+        with self._lock:
+            target = q / 100.0 * self.count
+            seen = 0
+            for bucket, n in enumerate(self.counts):
+                seen += n
+                if n and seen >= target:
+                    return min(bucket_upper_ms(bucket), self.max * 1000.0)
+        return 0.0
+
+    def summary(self):
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "total_ms": self.total * 1000.0,
+            "mean_ms": self.total / self.count * 1000.0,
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "p99_ms": self.percentile(99),
+            "max_ms": self.max * 1000.0,
+            "histogram": [[round(bucket_upper_ms(b), 4), n] for b, n in enumerate(self.counts) if n],
+        }
+
+class Metrics:
+    # Named histograms for one recording. Stage threads bind the pipeline's
+    # Metrics (see bind), and functions decorated with @timed record into
+    # whatever Metrics the calling thread is bound to.
+    def __init__(self):
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(name, Histogram())
+        return histogram
+
+    def add(self, name, seconds):
+        self.histogram(name).add(seconds)
+
+    def summary(self):
+        return {name: histogram.summary() for name, histogram in sorted(self.histograms.items())}
+
+_local = threading.local()
+
+def bind(metrics):
+    # Makes metrics the target of @timed calls made on this thread.
+    _local.metrics = metrics
+
+def current():
+    return getattr(_local, "metrics", None)
+
+class collecting:
+    # Binds metrics for the duration of a with-block, e.g. around the
+    # post-recording conversion steps that run on the caller's thread.
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    def __enter__(self):
+        self._previous = current()
+        bind(self.metrics)
+        return self.metrics
+
+    def __exit__(self, exc_type, exc, tb):
+        bind(self._previous)
+
+def timed(name):
+    # Costs one thread-local lookup when no Metrics is bound.
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            metrics = getattr(_local, "metrics", None)
+            if metrics is None:
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                metrics.add(name, time.perf_counter() - started)
+        return wrapper
+    return decorate
+
+class ThreadProfiles:
+    # Opt-in cProfile hook. cProfile only sees the thread that enabled it, so
+    # each pipeline thread runs its body under profile(name) and the results
+    # are merged afterwards.
+    def __init__(self):
+        self.profiles = {}
+        self._lock = threading.Lock()
+
+    def profile(self, name, func, *args):
+        profiler = cProfile.Profile()
+        with self._lock:
+            self.profiles[name] = profiler
+        return profiler.runcall(func, *args)
+
+    def stats(self):
+        merged = None
+        for profiler in self.profiles.values():
+            if merged is None:
+                merged = pstats.Stats(profiler, stream=io.StringIO())
+            else:
+                merged.add(profiler)
+        return merged
+
+    def dump(self, path, top=15):
+        # Writes the merged .prof file (for snakeviz, pstats, ...) and returns
+        # the top functions by cumulative time as text lines.
+        stats = self.stats()
+        if stats is None:
+            return []
+        stats.dump_stats(path)
+        stream = io.StringIO()
+        stats.stream = stream
+        stats.sort_stats("cumulative").print_stats(top)
+        return [line for line in stream.getvalue().splitlines() if line.strip()]
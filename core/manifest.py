@@ -0,0 +1,301 @@
+import csv
+import json
+import os
+import re
+import time
+
+CACHE_NAME = ".bids_manifest.json"
+CACHE_VERSION = 2
+# Folders whose mtime is this close to the previous scan are listed again:
+# on coarse-grained (e.g. NAS) file systems a change made in the same tick
+# as that scan would otherwise leave the mtime unchanged.
+MTIME_SLACK_NS = 2 * 10 ** 9
+
+_SEGMENT = re.compile(r"_split-\d{3}$")
+# Files that belong to a recording <base>: <base>.avi, <base>_split-NNN.avi,
+# <base>.h5, <base>_metadata.json, <base>.npy, <base>_raw.json, ...
+_BASE_SUFFIXES = ("_metadata.json", ".h5", ".avi")
+
+def bids_key(file_base):
+    # sub-*/ses-*/<type>/<name>: the part of a file base that survives the
+    # dataset being moved or recorded from a different working directory.
+    parts = os.path.normpath(file_base).replace("\\", "/").split("/")
+    return "/".join(parts[-4:])
+
+def _recording_bases(files):
+    bases = set()
+    for name in files:
+        for suffix in _BASE_SUFFIXES:
+            if name.endswith(suffix):
+                bases.add(_SEGMENT.sub("", name[:-len(suffix)]))
+    return bases
+
+def _owner(name, bases):
+    # Longest base the name belongs to, so video_acq-cam1.h5 goes to
+    # video_acq-cam1 rather than video.
+    owner = None
+    for base in bases:
+        if name.startswith(base) and name[len(base):len(base) + 1] in (".", "_"):
+            if owner is None or len(base) > len(owner):
+                owner = base
+    return owner
+
+def _metadata_summary(path):
+    with open(path) as f:
+        meta = json.load(f)
+    # The recorded rate, which differs from the camera's with frame averaging.
+    fps = ((meta.get("timing") or {}).get("target_fps") or (meta.get("pipeline") or {}).get("output_fps")
+           or (meta.get("camera_settings") or {}).get("fps"))
+    return {
+        "subject_id": meta.get("subject_id"),
+        "session_id": meta.get("session_id"),
+        "timestamp": meta.get("timestamp"),
+        "frame_count": meta.get("frame_count"),
+        "fps": fps,
+    }
+
+class DatasetManifest:
+    # Index of every recording under a BIDS root (sub-*/ses-*/<type>/),
+    # cached in <root>/.bids_manifest.json. A rescan stats each folder down
+    # to the data type level but only lists folders whose mtime changed, and
+    # only re-reads a _metadata.json whose path, mtime or size changed, so a
+    # scan of an unchanged archive costs one stat per folder.
+    def __init__(self, root, cache_file=None):
+        self.root = os.path.abspath(root)
+        self.cache_file = cache_file or os.path.join(self.root, CACHE_NAME)
+        self.dirs = {}
+        self.metadata = {}
+        self.scanned_at = 0
+        self.recordings = []
+        self.stats = {}
+        self._load_cache()
+
+    def _load_cache(self):
+        try:
+            with open(self.cache_file) as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            return
+        if cache.get("version") != CACHE_VERSION:
+            return
+        self.dirs = cache.get("dirs", {})
+        self.metadata = cache.get("metadata", {})
+        self.scanned_at = cache.get("scanned_at", 0)
+
+    def save(self):
+        partial = self.cache_file + ".partial"
+        with open(partial, 'w') as f:
+            json.dump({"version": CACHE_VERSION, "root": self.root, "scanned_at": self.scanned_at,
+                       "dirs": self.dirs, "metadata": self.metadata}, f)
+        os.replace(partial, self.cache_file)
+
+    def _list(self, rel, full):
+        # Cached listing of one folder: {"mtime_ns", "dirs": [...], "files":
+        # {name: [size, mtime_ns]}}; listed again only if its mtime moved.
+        path = os.path.join(self.root, rel)
+        mtime_ns = os.stat(path).st_mtime_ns
+        cached = self.dirs.get(rel)
+        if (not full and cached is not None and cached["mtime_ns"] == mtime_ns
+                and mtime_ns < self.scanned_at - MTIME_SLACK_NS):
+            self.stats["cached"] += 1
+            return cached
+        dirs, files = [], {}
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    dirs.append(entry.name)
+                elif entry.is_file():
+                    st = entry.stat()
+                    files[entry.name] = [st.st_size, st.st_mtime_ns]
+        listing = {"mtime_ns": mtime_ns, "dirs": sorted(dirs), "files": files}
+        self.stats["listed"] += 1
+        return listing
+
+    def _summary(self, rel, entry, full):
+        # Parsed _metadata.json, keyed on path + [size, mtime_ns].
+        cached = self.metadata.get(rel)
+        if (not full and cached is not None and cached["key"] == entry
+                and entry[1] < self.scanned_at - MTIME_SLACK_NS):
+            return cached["summary"]
+        try:
+            summary = _metadata_summary(os.path.join(self.root, rel))
+        except (OSError, ValueError):
+            summary = None
+        self.metadata[rel] = {"key": entry, "summary": summary}
+        self.stats["parsed"] += 1
+        return summary
+
+    def scan(self, full=False):
+        # Brings the index up to date; full=True ignores the cache.
+        started = time.time_ns()
+        self.stats = {"folders": 0, "listed": 0, "cached": 0, "parsed": 0}
+        dirs, recordings, metadata = {}, [], {}
+        pending = [("", 0)]
+        while pending:
+            rel, depth = pending.pop()
+            try:
+                listing = self._list(rel, full)
+            except FileNotFoundError:
+                continue
+            dirs[rel] = listing
+            self.stats["folders"] += 1
+            if depth < 3:
+                prefix = ("sub-", "ses-", "")[depth]
+                pending.extend((os.path.join(rel, name).replace("\\", "/"), depth + 1)
+                               for name in reversed(listing["dirs"]) if name.startswith(prefix))
+                continue
+            subject, session, task_type = rel.split("/")
+            bases = _recording_bases(listing["files"])
+            grouped = {base: [] for base in bases}
+            for name in list(listing["files"]) + [name + "/" for name in listing["dirs"]]:
+                owner = _owner(name.rstrip("/"), bases)
+                if owner is not None:
+                    grouped[owner].append(name)
+            for base in sorted(bases):
+                meta_name = base + "_metadata.json"
+                summary = None
+                if meta_name in listing["files"]:
+                    meta_rel = f"{rel}/{meta_name}"
+                    summary = self._summary(meta_rel, listing["files"][meta_name], full)
+                    metadata[meta_rel] = self.metadata[meta_rel]
+                files = sorted(grouped[base])
+                recordings.append({
+                    "file_base": f"{rel}/{base}",
+                    "subject_id": subject[len("sub-"):],
+                    "session_id": session[len("ses-"):],
+                    "task_type": task_type,
+                    "files": files,
+                    "bytes": sum(listing["files"][name][0] for name in files if name in listing["files"]),
+                    "has_metadata": summary is not None,
+                    "timestamp": summary and summary["timestamp"],
+                    "frame_count": summary and summary["frame_count"],
+                    "fps": summary and summary["fps"],
+                })
+        # Folders and metadata that disappeared drop out of the cache here.
+        self.dirs, self.metadata = dirs, metadata
+        self.recordings = recordings
+        self.scanned_at = started
+        return self
+
+    def participants(self):
+        # One row per subject: participant_id plus session and recording counts.
+        subjects = {}
+        for rec in self.recordings:
+            entry = subjects.setdefault(rec["subject_id"], {"sessions": set(), "recordings": 0})
+            entry["sessions"].add(rec["session_id"])
+            entry["recordings"] += 1
+        return [{"participant_id": f"sub-{subject}", "sessions": len(entry["sessions"]),
+                 "recordings": entry["recordings"]}
+                for subject, entry in sorted(subjects.items())]
+
+    def sessions(self, subject_id=None):
+        # One row per subject/session; acq_time is the earliest recording.
+        sessions = {}
+        for rec in self.recordings:
+            if subject_id is not None and rec["subject_id"] != subject_id:
+                continue
+            row = sessions.setdefault((rec["subject_id"], rec["session_id"]), {
+                "participant_id": f"sub-{rec['subject_id']}", "session_id": f"ses-{rec['session_id']}",
+                "acq_time": None, "recordings": 0, "frames": 0, "task_types": set(),
+            })
+            row["recordings"] += 1
+            row["frames"] += rec["frame_count"] or 0
+            row["task_types"].add(rec["task_type"])
+            if rec["timestamp"] and (row["acq_time"] is None or rec["timestamp"][:19] < row["acq_time"]):
+                row["acq_time"] = rec["timestamp"][:19]
+        rows = []
+        for key in sorted(sessions):
+            row = sessions[key]
+            row["task_types"] = ",".join(sorted(row["task_types"]))
+            row["acq_time"] = row["acq_time"] or "n/a"
+            rows.append(row)
+        return rows
+
+    def write_tables(self):
+        # participants.tsv at the root and sub-<label>/sub-<label>_sessions.tsv
+        # per subject. Columns added by hand to participants.tsv (age, sex,
+        # ...) are kept. Files are only rewritten when their content changes,
+        # so an unchanged dataset keeps its folder mtimes and cache hits.
+        written = []
+        path = os.path.join(self.root, "participants.tsv")
+        rows = self.participants()
+        columns = ["participant_id", "sessions", "recordings"]
+        existing = _read_tsv(path)
+        if existing:
+            extra = [c for c in existing[0] if c not in columns]
+            by_id = {row["participant_id"]: row for row in existing}
+            for row in rows:
+                old = by_id.pop(row["participant_id"], {})
+                row.update({c: old.get(c, "n/a") for c in extra})
+            # Participants without recordings stay listed.
+            rows.extend(dict(old, sessions=0, recordings=0) for old in by_id.values())
+            columns += extra
+        if _write_tsv(path, columns, rows):
+            written.append(path)
+        session_columns = ["session_id", "acq_time", "recordings", "frames", "task_types"]
+        for participant in self.participants():
+            subject = participant["participant_id"]
+            path = os.path.join(self.root, subject, f"{subject}_sessions.tsv")
+            if _write_tsv(path, session_columns, self.sessions(subject[len("sub-"):])):
+                written.append(path)
+        return written
+
+    def reconcile(self, catalog, fix=False, page_size=1000):
+        # Compares the recordings on disk with the catalog's sessions table,
+        # matching on sub-*/ses-*/<type>/<name>. Rows count as missing from
+        # disk only when their file_base resolves to a path under this root.
+        # With fix=True, recordings that have metadata but no row are
+        # inserted.
+        on_disk = {rec["file_base"]: rec for rec in self.recordings}
+        rows_by_key = {}
+        cursor = None
+        while True:
+            rows, cursor = catalog.query_sessions(limit=page_size, cursor=cursor)
+            for row in rows:
+                rows_by_key.setdefault(bids_key(row["file_base"] or ""), []).append(row)
+            if cursor is None:
+                break
+        report = {"matched": 0, "missing_in_catalog": [], "missing_on_disk": [],
+                  "frame_count_mismatch": [], "duplicates": []}
+        for key, rows in rows_by_key.items():
+            if len(rows) > 1:
+                report["duplicates"].append(key)
+            rec = on_disk.get(key)
+            if rec is None:
+                report["missing_on_disk"].extend(
+                    row["file_base"] for row in rows
+                    if os.path.abspath(row["file_base"] or "").startswith(self.root + os.sep))
+                continue
+            report["matched"] += 1
+            if rec["frame_count"] is not None and any(row["frame_count"] != rec["frame_count"] for row in rows):
+                report["frame_count_mismatch"].append(key)
+        for key, rec in on_disk.items():
+            if key not in rows_by_key and rec["has_metadata"]:
+                report["missing_in_catalog"].append(key)
+        if fix and report["missing_in_catalog"]:
+            catalog.insert_sessions([
+                (on_disk[key]["subject_id"], on_disk[key]["session_id"], on_disk[key]["timestamp"],
+                 on_disk[key]["frame_count"], os.path.join(self.root, *key.split("/")), on_disk[key]["task_type"])
+                for key in report["missing_in_catalog"]
+            ])
+        return report
+
+def _read_tsv(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, newline="") as f:
+        return list(csv.DictReader(f, delimiter="\t"))
+
+def _write_tsv(path, columns, rows):
+    lines = ["\t".join(columns)]
+    lines += ["\t".join(str(row.get(column, "n/a")) for column in columns) for row in rows]
+    content = "\n".join(lines) + "\n"
+    try:
+        with open(path) as f:
+            if f.read() == content:
+                return False
+    except OSError:
+        pass
+    with open(path, 'w', newline="") as f:
+        f.write(content)
+    return True
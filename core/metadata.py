@@ -1,15 +1,28 @@
 import json
 import datetime
+import os
+from core.instrument import timed
 
-def generate_metadata(subject_id, session_id, frame_count, camera_settings):
-    return {
+def generate_metadata(subject_id, session_id, frame_count, camera_settings, pipeline_stats=None, timing=None):
+    meta = {
         "subject_id": subject_id,
         "session_id": session_id,
         "timestamp": datetime.datetime.now().isoformat(),
         "frame_count": frame_count,
         "camera_settings": camera_settings
     }
+    if pipeline_stats is not None:
+        meta["pipeline"] = pipeline_stats
+    if timing is not None:
+        meta["timing"] = timing
+    return meta
 
+@timed("metadata.save")
 def save_metadata_to_json(metadata, filename):
-    with open(filename, 'w') as f:
-        json.dump(metadata, f, indent=4)
\ No newline at end of file
+    # Written to a temporary file and renamed over the old one, so readers
+    # never see half a file and the folder's mtime changes on every save,
+    # which is what core/manifest.py relies on to skip unchanged folders.
+    partial = filename + ".partial"
+    with open(partial, 'w') as f:
+        json.dump(metadata, f, indent=4)
+    os.replace(partial, filename)
\ No newline at end of file
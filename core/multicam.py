@@ -0,0 +1,106 @@
+import math
+import time
+import numpy as np
+from core.pipeline import RecordingPipeline, BLOCK
+
+class MultiCameraRecorder:
+    # One RecordingPipeline (and so one capture thread) per device. All
+    # pipelines share start_at, so their frame deadlines fall on the same
+    # monotonic schedule and reads from different devices overlap instead of
+    # running one after another.
+    def __init__(self, caps, total_frames, fps, policy=BLOCK, pretrigger_seconds=0, start_delay=0.2, profile=False,
+                 preprocess=None, gate=None):
+        self.fps = fps
+        self.start_delay = start_delay
+        self.start_at = None
+        self.pipelines = {
+            label: RecordingPipeline(cap, total_frames, fps, policy=policy, pretrigger_seconds=pretrigger_seconds,
+                                     profile=profile, preprocess=preprocess, gate=gate)
+            for label, cap in caps.items()
+        }
+        # Every stream shares the preprocessing options, so also the output rate.
+        self.output_fps = next(iter(self.pipelines.values())).output_fps if self.pipelines else fps
+
+    @property
+    def labels(self):
+        return list(self.pipelines)
+
+    def start(self):
+        # A short delay lets every capture thread spin up before the first
+        # shared deadline.
+        self.start_at = time.monotonic() + self.start_delay
+        for pipeline in self.pipelines.values():
+            pipeline.start_at = self.start_at
+            pipeline.start()
+
+    def stop(self):
+        for pipeline in self.pipelines.values():
+            pipeline.stop()
+
+    def trigger(self):
+        for pipeline in self.pipelines.values():
+            pipeline.trigger()
+
+    def is_alive(self):
+        return any(pipeline.is_alive() for pipeline in self.pipelines.values())
+
+    def join(self):
+        first_error = None
+        for pipeline in self.pipelines.values():
+            try:
+                pipeline.join()
+            except Exception as e:
+                if first_error is None:
+                    first_error = e
+        if first_error is not None:
+            raise first_error
+
+    def sync_table(self):
+        # Aligns every stream to a shared grid of ticks start_at + k / output_fps:
+        # each tick gets the nearest frame of each stream, or -1 if that
+        # stream has no frame within half a frame interval of it.
+        interval = 1.0 / self.output_fps
+        times = {label: np.asarray(p.monotonic_times, dtype=np.float64) for label, p in self.pipelines.items()}
+        recorded = [t for t in times.values() if t.size]
+        if not recorded or self.start_at is None:
+            return {"tick": np.empty(0, dtype=np.int64), "time_s": np.empty(0), "streams": {}}
+        first = min(t[0] for t in recorded)
+        last = max(t[-1] for t in recorded)
+        k0 = math.floor((first - self.start_at) / interval + 0.5)
+        k1 = math.floor((last - self.start_at) / interval + 0.5)
+        ticks = np.arange(k0, k1 + 1)
+        grid = self.start_at + ticks * interval
+        streams = {}
+        for label, t in times.items():
+            frames = np.full(grid.size, -1, dtype=np.int64)
+            offsets = np.full(grid.size, np.nan)
+            if t.size:
+                right = np.clip(np.searchsorted(t, grid), 0, t.size - 1)
+                left = np.clip(right - 1, 0, t.size - 1)
+                nearest = np.where(np.abs(t[left] - grid) <= np.abs(t[right] - grid), left, right)
+                offset = t[nearest] - grid
+                matched = np.abs(offset) <= interval / 2
+                frames[matched] = nearest[matched]
+                offsets[matched] = offset[matched] * 1000.0
+            streams[label] = {"frame": frames, "offset_ms": offsets}
+        return {"tick": ticks, "time_s": grid - self.start_at, "streams": streams}
+
+    def write_sync_table(self, path):
+        table = self.sync_table()
+        labels = list(table["streams"])
+        header = ["tick", "time_s"]
+        for label in labels:
+            header += [f"{label}_frame", f"{label}_offset_ms"]
+        with open(path, 'w') as f:
+            f.write("\t".join(header) + "\n")
+            for row, tick in enumerate(table["tick"]):
+                values = [str(int(tick)), f"{table['time_s'][row]:.6f}"]
+                for label in labels:
+                    stream = table["streams"][label]
+                    offset = stream["offset_ms"][row]
+                    values += [str(int(stream["frame"][row])), "n/a" if np.isnan(offset) else f"{offset:.3f}"]
+                f.write("\t".join(values) + "\n")
+        return path
+
+    def stats(self):
+        return {label: pipeline.stats() for label, pipeline in self.pipelines.items()}
@@ -0,0 +1,56 @@
+import math
+import time
+import numpy as np
+
+class FramePacer:
+    # Schedules reads against absolute deadlines start + n / fps on the
+    # monotonic clock, so time spent reading or handing off a frame never
+    # accumulates as drift. A pacer that falls behind reads immediately to
+    # catch up; once it is more than max_lag_frames behind it skips the
+    # missed slots instead of bursting through them.
+    def __init__(self, fps, max_lag_frames=2, clock=time.monotonic, start=None):
+        # start pins slot 0 to a given clock time, so several pacers can share
+        # one schedule; by default it is the time of the first wait().
+        self.interval = 1.0 / fps
+        self.max_lag = max_lag_frames * self.interval
+        self.clock = clock
+        self.start = start
+        self.slot = 0
+        self.skipped = 0
+
+    def wait(self, stop_event=None):
+        # Returns how late this slot is in seconds (0 when on time), or None
+        # if stop_event was set while waiting.
+        now = self.clock()
+        if self.start is None:
+            self.start = now
+        deadline = self.start + self.slot * self.interval
+        lateness = now - deadline
+        if lateness < 0:
+            if stop_event is not None:
+                if stop_event.wait(-lateness):
+                    return None
+            else:
+                time.sleep(-lateness)
+            lateness = 0.0
+        elif lateness > self.max_lag:
+            missed = math.floor(lateness / self.interval)
+            self.skipped += missed
+            self.slot += missed
+            lateness -= missed * self.interval
+        self.slot += 1
+        return lateness
+
+def timing_summary(monotonic_times, target_fps):
+    times = np.asarray(monotonic_times, dtype=np.float64)
+    summary = {"target_fps": target_fps, "frames": int(times.size)}
+    if times.size < 2:
+        return summary
+    intervals = np.diff(times)
+    summary.update({
+        "achieved_fps": float((times.size - 1) / (times[-1] - times[0])) if times[-1] > times[0] else 0.0,
+        "mean_interval_ms": float(intervals.mean() * 1000.0),
+        "jitter_ms": float(intervals.std() * 1000.0),
+        "max_interval_ms": float(intervals.max() * 1000.0),
+    })
+    return summary
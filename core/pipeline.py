@@ -0,0 +1,459 @@
+import queue
+import threading
+import time
+from array import array
+import cv2
+import numpy as np
+from core import camera, instrument
+from core.framestore import RingFrameStore
+from core.pacing import FramePacer, timing_summary
+from core.preprocess import FramePreprocessor
+from core.gating import ActivityGate
+
+BLOCK = "block"
+DROP_OLDEST = "drop_oldest"
+POLICIES = (BLOCK, DROP_OLDEST)
+
+_STOP = object()
+
+class StageCounters:
+    def __init__(self):
+        self.processed = 0
+        self.dropped = 0
+        self.late = 0
+        self._lock = threading.Lock()
+
+    def add(self, processed=0, dropped=0, late=0):
+        with self._lock:
+            self.processed += processed
+            self.dropped += dropped
+            self.late += late
+
+    def as_dict(self):
+        with self._lock:
+            return {"processed": self.processed, "dropped": self.dropped, "late": self.late}
+
+class Stage(threading.Thread):
+    # A consumer fed by a bounded queue. The handler receives
+    # (index, timestamp, frame) and runs on this stage's own thread. Frames
+    # may be ring-buffer slots that are reused once the handler returns, so a
+    # handler that needs the pixels later must copy them. Handler time and
+    # capture-to-done latency go into metrics as "<name>" and "<name>.latency".
+    def __init__(self, name, handler, maxsize=64, policy=BLOCK, late_after=None, on_close=None,
+                 release=None, live=False, metrics=None, profiles=None):
+        super().__init__(name=f"stage-{name}", daemon=True)
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown backpressure policy: {policy}")
+        self.stage_name = name
+        self.handler = handler
+        self.policy = policy
+        self.late_after = late_after
+        self.on_close = on_close
+        self.release = release
+        # Live stages (the preview) also see frames while a pre-trigger
+        # recording is armed; the others only see recorded frames.
+        self.live = live
+        self.counters = StageCounters()
+        self.metrics = metrics or instrument.Metrics()
+        self.profiles = profiles
+        # Per-frame latency in ms, indexed by frame number; set by the
+        # pipeline before the stage starts.
+        self.latencies = None
+        self.error = None
+        self._queue = queue.Queue(maxsize=maxsize)
+
+    def _release(self, item):
+        if self.release is not None and item[3] is not None:
+            self.release(item[3])
+
+    def submit(self, item):
+        if self.policy == BLOCK:
+            self._queue.put(item)
+            return
+        while True:
+            try:
+                self._queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    dropped = self._queue.get_nowait()
+                except queue.Empty:
+                    continue
+                if dropped is _STOP:
+                    self._queue.put(dropped)
+                    return
+                self._release(dropped)
+                self.counters.add(dropped=1)
+
+    def close(self):
+        # The stop marker always blocks so it is never dropped.
+        self._queue.put(_STOP)
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def run(self):
+        if self.profiles is not None:
+            self.profiles.profile(self.name, self._run)
+        else:
+            self._run()
+
+    def _run(self):
+        instrument.bind(self.metrics)
+        handler_histogram = self.metrics.histogram(self.stage_name)
+        latency_histogram = self.metrics.histogram(self.stage_name + ".latency")
+        try:
+            while True:
+                item = self._queue.get()
+                if item is _STOP:
+                    break
+                index, timestamp, frame, slot, backlog = item
+                try:
+                    if self.error is not None:
+                        continue
+                    started = time.perf_counter()
+                    try:
+                        self.handler(index, timestamp, frame)
+                    except Exception as e:
+                        self.error = e
+                        continue
+                    handler_histogram.add(time.perf_counter() - started)
+                    latency = time.monotonic() - timestamp
+                    latency_histogram.add(latency)
+                    if self.latencies is not None and index is not None and index < len(self.latencies):
+                        self.latencies[index] = latency * 1000.0
+                    late = (not backlog and self.late_after is not None
+                            and latency > self.late_after)
+                    self.counters.add(processed=1, late=int(late))
+                finally:
+                    self._release(item)
+        finally:
+            if self.on_close is not None:
+                try:
+                    self.on_close()
+                except Exception as e:
+                    if self.error is None:
+                        self.error = e
+
+class RecordingPipeline:
+    # Captures into a RingFrameStore. With pretrigger_seconds > 0 the
+    # pipeline starts armed: it keeps the last pretrigger_seconds of frames in
+    # the ring and only starts recording when trigger() is called, flushing
+    # the buffered frames ahead of the ones that follow. total_frames counts
+    # camera frames read from the trigger onwards. preprocess is a dict of
+    # FramePreprocessor options; frames are reduced as they are read, so the
+    # ring and every stage only see the reduced frames, and averaging over N
+    # frames records total_frames // N frames at output_fps = fps / N. gate
+    # is a dict of ActivityGate options; with it, frames after the trigger
+    # are only recorded during active epochs (plus padding) and idle frames
+    # go to live stages only.
+    def __init__(self, cap, total_frames, fps, policy=BLOCK, queue_size=64, max_lag_frames=2,
+                 ring_capacity=None, pretrigger_seconds=0, start_at=None, profile=False, preprocess=None,
+                 gate=None):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown backpressure policy: {policy}")
+        self.cap = cap
+        self.preprocessor = FramePreprocessor(**preprocess) if preprocess else None
+        if self.preprocessor is not None and self.preprocessor.identity:
+            self.preprocessor = None
+        average = self.preprocessor.average if self.preprocessor else 1
+        self.total_frames = total_frames // average
+        self.fps = fps
+        self.output_fps = fps / average
+        self.policy = policy
+        self.queue_size = queue_size
+        self.frame_interval = 1.0 / fps
+        self.max_lag_frames = max_lag_frames
+        self.pretrigger_frames = int(round(pretrigger_seconds * self.output_fps))
+        # Monotonic time of the first frame deadline; pipelines given the same
+        # start_at capture on a shared schedule.
+        self.start_at = start_at
+        self.gate = ActivityGate(**gate) if gate else None
+        # Frames kept in the ring for a later flush: pre-trigger or pre-activity.
+        lookback = max(self.pretrigger_frames, self.gate.pre_frames if self.gate else 0)
+        minimum = lookback + 2
+        capacity = ring_capacity or lookback + queue_size + 4
+        if capacity < minimum:
+            raise ValueError(f"Ring capacity {capacity} cannot hold {lookback} buffered frames")
+        self.frame_store = RingFrameStore(capacity)
+        # Per-frame capture times: monotonic seconds and the device's
+        # CAP_PROP_POS_MSEC, indexed by frame number.
+        self.monotonic_times = array('d')
+        self.device_times = array('d')
+        self.stages = []
+        self.capture_counters = StageCounters()
+        self.metrics = instrument.Metrics()
+        # Opt-in cProfile of the capture and stage threads.
+        self.profiles = instrument.ThreadProfiles() if profile else None
+        self.frame_latency = None
+        # Set by recording.add_storage_stages when per-frame stats are on.
+        self.frame_stats = None
+        self._raw = None
+        self._group_stamp = None
+        # With a gate: score, capture time and recorded frame index (-1 when
+        # idle) of every frame after the trigger, and [first, last] recorded
+        # frame index of each active epoch.
+        self.activity_scores = array('f')
+        self.activity_times = array('d')
+        self.activity_frames = array('l')
+        self.epochs = []
+        self.frame_count = 0
+        self.pretrigger_recorded = 0
+        self._last_recorded = -1
+        self.error = None
+        self._stop_event = threading.Event()
+        self._trigger_event = threading.Event()
+        self._thread = threading.Thread(target=self._capture_loop, name="capture", daemon=True)
+        self._started_at = None
+        self._finished_at = None
+        self._last_read_at = None
+
+    def add_stage(self, name, handler, policy=None, maxsize=None, on_close=None, live=False):
+        stage = Stage(
+            name,
+            handler,
+            maxsize=maxsize or self.queue_size,
+            policy=policy or self.policy,
+            late_after=1.0 / self.output_fps,
+            on_close=on_close,
+            release=self.frame_store.release,
+            live=live,
+            metrics=self.metrics,
+            profiles=self.profiles,
+        )
+        self.stages.append(stage)
+        return stage
+
+    def start(self):
+        # (frames, stages) latency table in ms, NaN for frames a stage dropped.
+        self.frame_latency = np.full((self.total_frames + self.pretrigger_frames, len(self.stages)), np.nan,
+                                     dtype=np.float32)
+        for column, stage in enumerate(self.stages):
+            stage.latencies = self.frame_latency[:, column]
+        for stage in self.stages:
+            stage.start()
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def trigger(self):
+        self._trigger_event.set()
+
+    @property
+    def armed(self):
+        return self.pretrigger_frames > 0 and not self._trigger_event.is_set()
+
+    def is_alive(self):
+        return self._thread.is_alive() or any(stage.is_alive() for stage in self.stages)
+
+    def join(self):
+        self._thread.join()
+        for stage in self.stages:
+            stage.join()
+        if self.error is not None:
+            raise self.error
+        for stage in self.stages:
+            if stage.error is not None:
+                raise stage.error
+
+    def _dispatch(self, index, slot, stages, backlog=False):
+        store = self.frame_store
+        if not stages:
+            return
+        store.hold(slot, len(stages))
+        item = (index, store.monotonic_times[slot], store.frames[slot], slot, backlog)
+        for stage in stages:
+            stage.submit(item)
+
+    def _record(self, sequence, stages, backlog=False):
+        slot = self.frame_store.slot(sequence)
+        self.monotonic_times.append(self.frame_store.monotonic_times[slot])
+        self.device_times.append(self.frame_store.device_times[slot])
+        self._dispatch(self.frame_count, slot, stages, backlog)
+        self._last_recorded = sequence
+        self.frame_count += 1
+
+    def _flush_pretrigger(self, sequence):
+        count = min(self.pretrigger_frames, sequence)
+        stages = [stage for stage in self.stages if not stage.live]
+        for buffered in range(sequence - count, sequence):
+            self._record(buffered, stages, backlog=True)
+        self.pretrigger_recorded = count
+
+    def _gate_frame(self, sequence, score, live_stages):
+        # Records the frame if the gate is active. On opening, the last
+        # pre_frames idle frames still in the ring are flushed first.
+        slot = self.frame_store.slot(sequence)
+        opened, active = self.gate.update(score)
+        self.activity_scores.append(score)
+        self.activity_times.append(self.frame_store.monotonic_times[slot])
+        self.activity_frames.append(-1)
+        if opened:
+            first = max(sequence - self.gate.pre_frames, self._last_recorded + 1)
+            self.epochs.append([self.frame_count, self.frame_count])
+            stages = [stage for stage in self.stages if not stage.live]
+            offset = len(self.activity_frames) - 1 - sequence
+            for buffered in range(first, sequence):
+                self.activity_frames[buffered + offset] = self.frame_count
+                self._record(buffered, stages, backlog=True)
+        if active:
+            self.activity_frames[-1] = self.frame_count
+            self.epochs[-1][1] = self.frame_count
+            self._record(sequence, self.stages)
+        else:
+            self._dispatch(None, slot, live_stages)
+
+    def _read_into(self, slot):
+        # Reads the next camera frame into the ring slot, through the
+        # preprocessor when there is one. Returns False while an averaged
+        # frame is still accumulating; an averaged frame is stamped with the
+        # time of the first frame in its group.
+        store = self.frame_store
+        if self.preprocessor is None:
+            if store.allocated:
+                camera.read_frame(self.cap, out=store.frames[slot])
+            else:
+                first = camera.read_frame(self.cap)
+                store.allocate(first.shape, first.dtype)[slot] = first
+            store.stamp(slot, time.monotonic(), self.cap.get(cv2.CAP_PROP_POS_MSEC))
+            return True
+        self._raw = camera.read_frame(self.cap, out=self._raw)
+        if not store.allocated:
+            store.allocate(self.preprocessor.prepare(self._raw.shape), self._raw.dtype)
+        if self._group_stamp is None:
+            self._group_stamp = (time.monotonic(), self.cap.get(cv2.CAP_PROP_POS_MSEC))
+        if not self.preprocessor.process(self._raw, store.frames[slot]):
+            return False
+        store.stamp(slot, *self._group_stamp)
+        self._group_stamp = None
+        return True
+
+    def _capture_loop(self):
+        if self.profiles is not None:
+            self.profiles.profile("capture", self._capture)
+        else:
+            self._capture()
+
+    def _capture(self):
+        instrument.bind(self.metrics)
+        loop_histogram = self.metrics.histogram("capture.loop")
+        pacer = FramePacer(self.fps, max_lag_frames=self.max_lag_frames, start=self.start_at)
+        store = self.frame_store
+        live_stages = [stage for stage in self.stages if stage.live]
+        armed = self.pretrigger_frames > 0
+        sequence = 0
+        counted = 0
+        try:
+            while counted < self.total_frames:
+                skipped = pacer.skipped
+                lateness = pacer.wait(self._stop_event)
+                if lateness is None or self._stop_event.is_set():
+                    break
+                if self._started_at is None:
+                    # The clock starts at the first frame deadline, not
+                    # before a shared start delay.
+                    self._started_at = pacer.start
+                started = time.perf_counter()
+                slot = store.acquire(sequence, self._stop_event)
+                if slot is None:
+                    break
+                ready = self._read_into(slot)
+                self._last_read_at = time.monotonic()
+                late = lateness > self.frame_interval / 2
+                self.capture_counters.add(processed=1, dropped=pacer.skipped - skipped, late=int(late))
+                if not ready:
+                    loop_histogram.add(time.perf_counter() - started)
+                    continue
+                score = self.gate.score(store.frames[slot]) if self.gate is not None else None
+                if armed and self._trigger_event.is_set():
+                    self._flush_pretrigger(sequence)
+                    armed = False
+                if armed:
+                    self._dispatch(None, slot, live_stages)
+                elif self.gate is not None:
+                    # With gating, total_frames bounds the session length
+                    # rather than the number of frames stored.
+                    self._gate_frame(sequence, score, live_stages)
+                    counted += 1
+                else:
+                    self._record(sequence, self.stages)
+                    counted += 1
+                sequence += 1
+                loop_histogram.add(time.perf_counter() - started)
+        except Exception as e:
+            self.error = e
+        finally:
+            self._finished_at = time.monotonic()
+            for stage in self.stages:
+                stage.close()
+
+    def latency_table(self):
+        # Stage names and the per-frame latency table (ms), trimmed to the
+        # frames actually recorded.
+        if self.frame_latency is None:
+            return [], np.empty((0, 0), dtype=np.float32)
+        return [stage.stage_name for stage in self.stages], self.frame_latency[:self.frame_count]
+
+    def activity(self):
+        # Per-frame score table and epoch table for storage, or None without
+        # a gate. Epoch rows: first frame, last frame, start and stop time
+        # (monotonic seconds) and the peak score inside the epoch.
+        if self.gate is None:
+            return None
+        scores = np.column_stack([
+            np.asarray(self.activity_times, dtype=np.float64),
+            np.asarray(self.activity_scores, dtype=np.float64),
+            np.asarray(self.activity_frames, dtype=np.float64),
+        ]).reshape(-1, 3)
+        epochs = []
+        for first, last in self.epochs:
+            inside = (scores[:, 2] >= first) & (scores[:, 2] <= last)
+            peak = float(scores[inside, 1].max()) if inside.any() else 0.0
+            epochs.append([first, last, self.monotonic_times[first], self.monotonic_times[last], peak])
+        return {
+            "scores": scores,
+            "score_columns": ["monotonic_s", "score", "frame_index"],
+            "epochs": np.array(epochs, dtype=np.float64).reshape(-1, 5),
+            "epoch_columns": ["first_frame", "last_frame", "start_s", "stop_s", "peak_score"],
+        }
+
+    def timing(self):
+        summary = timing_summary(self.monotonic_times, self.output_fps)
+        summary["skipped_slots"] = self.capture_counters.as_dict()["dropped"]
+        return summary
+
+    def _gating_stats(self):
+        if self.gate is None:
+            return None
+        seen = len(self.activity_frames)
+        active = sum(1 for index in self.activity_frames if index >= 0)
+        return dict(self.gate.describe(), epochs=len(self.epochs), frames_scored=seen,
+                    frames_active=active, active_fraction=active / seen if seen else 0.0)
+
+    def stats(self):
+        duration = 0.0
+        if self._started_at is not None:
+            duration = (self._finished_at or time.monotonic()) - self._started_at
+        stages = {"capture": self.capture_counters.as_dict()}
+        for stage in self.stages:
+            stages[stage.stage_name] = stage.counters.as_dict()
+        captured = stages["capture"]["processed"]
+        # Frames per interval between the first deadline and the last read,
+        # the same measure as timing_summary's achieved_fps.
+        achieved = 0.0
+        if captured > 1 and self._last_read_at is not None and self._last_read_at > self._started_at:
+            achieved = (captured - 1) / (self._last_read_at - self._started_at)
+        return {
+            "target_fps": self.fps,
+            "output_fps": self.output_fps,
+            "achieved_fps": achieved,
+            "duration_seconds": duration,
+            "frames_captured": self.frame_count,
+            "backpressure_policy": self.policy,
+            "queue_size": self.queue_size,
+            "ring_capacity": self.frame_store.capacity,
+            "pretrigger_frames": self.pretrigger_recorded,
+            "gating": self._gating_stats(),
+            "stages": stages,
+        }
@@ -0,0 +1,314 @@
+import bisect
+import os
+import queue
+import struct
+import threading
+import time
+import cv2
+import numpy as np
+
+AVIIF_KEYFRAME = 0x10
+_IDX1_ENTRY = np.dtype([('ckid', 'S4'), ('flags', '<u4'), ('offset', '<u4'), ('size', '<u4')])
+
+def index_cache_path(video_file):
+    return video_file + ".seekidx.npz"
+
+def _read_odml_index(f, indx):
+    # Follows an OpenDML super index ('indx' with bIndexType 0) to its
+    # 'ix##' standard index chunks, which cover every RIFF of a file over
+    # 1 GB; 'idx1' only covers the first. Returns (keyframe flags, absolute
+    # offsets) or None.
+    longs, _, index_type, count = struct.unpack_from('<HBBI', indx, 0)
+    if index_type != 0 or longs != 4:
+        return None
+    flags, offsets = [], []
+    for i in range(count):
+        offset, size, _ = struct.unpack_from('<QII', indx, 24 + 16 * i)
+        f.seek(offset)
+        chunk = f.read(size)
+        if len(chunk) < 32 or chunk[:2] != b'ix':
+            return None
+        sub_longs, _, sub_type, entries = struct.unpack_from('<HBBI', chunk, 8)
+        base, = struct.unpack_from('<Q', chunk, 20)
+        if sub_type != 1 or sub_longs != 2:
+            return None
+        table = np.frombuffer(chunk, dtype='<u4', count=2 * entries, offset=32).reshape(-1, 2)
+        # Bit 31 of the size marks a delta (non-key) frame.
+        flags.append((table[:, 1] & 0x80000000) == 0)
+        offsets.append(table[:, 0].astype(np.int64) + base)
+    if not flags:
+        return None
+    return np.concatenate(flags), np.concatenate(offsets)
+
+def _video_super_index(f, hdrl_end):
+    # Scans the 'hdrl' list for the first video stream's 'indx' chunk.
+    while f.tell() < hdrl_end:
+        chunk = f.read(8)
+        if len(chunk) < 8:
+            return None
+        ckid, size = struct.unpack('<4sI', chunk)
+        end = f.tell() + size + (size & 1)
+        if ckid == b'LIST' and f.read(4) == b'strl':
+            stream_type = None
+            while f.tell() < end:
+                sub = f.read(8)
+                if len(sub) < 8:
+                    break
+                sub_id, sub_size = struct.unpack('<4sI', sub)
+                data = f.read(sub_size + (sub_size & 1))
+                if sub_id == b'strh':
+                    stream_type = data[:4]
+                elif sub_id == b'indx' and stream_type == b'vids':
+                    return data[:sub_size]
+        f.seek(end)
+    return None
+
+def read_avi_index(video_file):
+    # Returns (keyframe flags, absolute offsets) for the first video stream
+    # of a RIFF AVI, or None if the file has no index. The OpenDML super
+    # index is preferred; otherwise the legacy 'idx1' chunk is used, which
+    # in a file over 1 GB only covers the frames in its first RIFF.
+    with open(video_file, 'rb') as f:
+        header = f.read(12)
+        if len(header) < 12:
+            return None
+        riff, _, form = struct.unpack('<4sI4s', header)
+        if riff != b'RIFF' or form != b'AVI ':
+            return None
+        movi_start = None
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                return None
+            ckid, size = struct.unpack('<4sI', chunk)
+            if ckid == b'LIST':
+                list_type = f.read(4)
+                end = f.tell() - 4 + size + (size & 1)
+                if list_type == b'hdrl':
+                    super_index = _video_super_index(f, end)
+                    if super_index is not None:
+                        index = _read_odml_index(f, super_index)
+                        if index is not None:
+                            return index
+                elif list_type == b'movi':
+                    movi_start = f.tell() - 4
+                f.seek(end)
+            elif ckid == b'idx1':
+                entries = np.frombuffer(f.read(size), dtype=_IDX1_ENTRY)
+                break
+            else:
+                f.seek(size + (size & 1), 1)
+    video_ids = [ckid for ckid in entries['ckid'] if ckid[2:] in (b'dc', b'db')]
+    if not video_ids:
+        return None
+    stream = video_ids[0][:2]
+    entries = entries[np.array([ckid[:2] == stream and ckid[2:] in (b'dc', b'db') for ckid in entries['ckid']], dtype=bool)]
+    offsets = entries['offset'].astype(np.int64)
+    # Offsets are relative to the 'movi' list in most writers, absolute in some.
+    if movi_start is not None and offsets.size and offsets[0] < movi_start:
+        offsets += movi_start
+    return (entries['flags'] & AVIIF_KEYFRAME) != 0, offsets
+
+def load_seek_index(video_file, rebuild=False):
+    # (keyframe numbers, number of indexed frames) for video_file, cached
+    # next to it and rebuilt when the file's size or mtime changes. Returns
+    # None when the container has no usable index, in which case seeks fall
+    # back to OpenCV.
+    stat = os.stat(video_file)
+    cache = index_cache_path(video_file)
+    if not rebuild and os.path.exists(cache):
+        try:
+            with np.load(cache) as data:
+                if int(data['size']) == stat.st_size and float(data['mtime']) == stat.st_mtime:
+                    return (data['keyframes'], int(data['frames'])) if data['keyframes'].size else None
+        except (OSError, KeyError, ValueError):
+            pass
+    index = read_avi_index(video_file)
+    keyframes = np.flatnonzero(index[0]) if index is not None else np.empty(0, dtype=np.int64)
+    frames = len(index[0]) if index is not None else 0
+    try:
+        np.savez(cache, keyframes=keyframes, frames=frames, size=stat.st_size, mtime=stat.st_mtime)
+    except OSError:
+        pass
+    return (keyframes, frames) if keyframes.size else None
+
+class AVIPlayer:
+    # Decodes on a background thread into a bounded prefetch queue. A seek
+    # forward within forward_grab_limit frames, or to a frame that the seek
+    # index shows is in the same GOP as the current position, just grab()s
+    # forward, which skips colour conversion. Anything else is left to
+    # OpenCV's own seek, which already decodes forward from the keyframe.
+    def __init__(self, video_file, prefetch=32, forward_grab_limit=60):
+        self.video_file = video_file
+        self.cap = cv2.VideoCapture(video_file)
+        if not self.cap.isOpened():
+            raise RuntimeError(f"Cannot open video file: {video_file}")
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30.0
+        self.frame_total = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        index = load_seek_index(video_file)
+        self.keyframes, self.indexed_frames = index if index is not None else (None, 0)
+        self.forward_grab_limit = forward_grab_limit
+        self._frames = queue.Queue(maxsize=prefetch)
+        self._lock = threading.Lock()
+        self._seek_request = None
+        self._generation = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._decode_loop, daemon=True)
+        self._thread.start()
+
+    def _keyframe_before(self, target):
+        if self.keyframes is None:
+            return None
+        i = bisect.bisect_right(self.keyframes, target) - 1
+        return int(self.keyframes[max(i, 0)])
+
+    def _seek(self, target, position):
+        target = min(max(target, 0), max(self.frame_total - 1, 0))
+        ahead = target - position
+        # Past the end of the index nothing is known about the keyframes.
+        same_gop = (0 <= ahead and target < self.indexed_frames
+                    and self._keyframe_before(target) <= position)
+        if not (0 <= ahead <= self.forward_grab_limit or same_gop):
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, target)
+            return target
+        while position < target and self.cap.grab():
+            position += 1
+        return position
+
+    def _put(self, item, generation):
+        while not self._stop.is_set():
+            with self._lock:
+                if generation != self._generation:
+                    return
+            try:
+                self._frames.put(item, timeout=0.05)
+                return
+            except queue.Full:
+                continue
+
+    def _decode_loop(self):
+        position = 0
+        at_end = False
+        while not self._stop.is_set():
+            with self._lock:
+                target = self._seek_request
+                self._seek_request = None
+                generation = self._generation
+            if target is not None:
+                position = self._seek(target, position)
+                at_end = False
+            if at_end:
+                self._stop.wait(0.02)
+                continue
+            ret, frame = self.cap.read()
+            if not ret:
+                at_end = True
+                self._put((generation, None, None), generation)
+                continue
+            self._put((generation, position, frame), generation)
+            position += 1
+
+    def seek(self, target):
+        with self._lock:
+            self._seek_request = int(target)
+            self._generation += 1
+        while True:
+            try:
+                self._frames.get_nowait()
+            except queue.Empty:
+                break
+
+    def next_frame(self, timeout=None):
+        # Returns (index, frame), (None, None) at the end of the file, or None
+        # if nothing was decoded within timeout.
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                generation, index, frame = self._frames.get(timeout=remaining)
+            except queue.Empty:
+                return None
+            with self._lock:
+                current = self._generation
+            if generation == current:
+                return index, frame
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        self.cap.release()
+
+def preview_avi(video_file, after):
+    # Paced at the container FPS (x speed). Keys: space pause, '.'/',' step,
+    # 1/2/4 speed, q quit; the trackbar seeks. Only decoding runs in the
+    # background: HighGUI is not thread-safe, so the window is driven from
+    # the caller's main loop, with after(ms, callback) (e.g. Tk's root.after)
+    # scheduling each poll. Raises RuntimeError if the file cannot be opened.
+    player = AVIPlayer(video_file)
+    window = "AVI Preview (space: pause, ./,: step, 1/2/4: speed, q: close)"
+    state = {"shown": -1, "seek": None, "speed": 1, "paused": False, "step": False,
+             "deadline": time.monotonic()}
+
+    def on_trackbar(value):
+        if value != state["shown"]:
+            state["seek"] = value
+
+    def close():
+        player.close()
+        cv2.destroyWindow(window)
+
+    def poll():
+        if cv2.getWindowProperty(window, cv2.WND_PROP_VISIBLE) < 1:
+            close()
+            return
+        if state["seek"] is not None:
+            player.seek(state["seek"])
+            state["seek"] = None
+            state["step"] = True
+            state["deadline"] = time.monotonic()
+        key = cv2.waitKey(1) & 0xFF
+        if key == ord('q'):
+            close()
+            return
+        if key == ord(' '):
+            state["paused"] = not state["paused"]
+            state["deadline"] = time.monotonic()
+        elif key == ord('.'):
+            state["paused"] = state["step"] = True
+        elif key == ord(','):
+            state["paused"] = True
+            state["seek"] = max(state["shown"] - 1, 0)
+        elif key in (ord('1'), ord('2'), ord('4')):
+            state["speed"] = int(chr(key))
+        show = state["step"] or not state["paused"]
+        if show and state["seek"] is None and time.monotonic() >= state["deadline"]:
+            item = player.next_frame(timeout=0)
+            if item is not None:
+                index, frame = item
+                if frame is None:
+                    state["paused"] = True
+                    state["step"] = False
+                else:
+                    cv2.imshow(window, frame)
+                    state["shown"] = index
+                    state["step"] = False
+                    cv2.setTrackbarPos("Frame", window, index)
+                    interval = 1.0 / (player.fps * state["speed"])
+                    # Stay on the absolute schedule, but never burst to catch
+                    # up by more than one frame.
+                    state["deadline"] = max(state["deadline"] + interval, time.monotonic() - interval)
+        now = time.monotonic()
+        if state["seek"] is not None:
+            delay = 1
+        elif state["paused"] and not state["step"]:
+            delay = 30
+        elif now < state["deadline"]:
+            delay = int((state["deadline"] - now) * 1000)
+        else:
+            # Due, but the decoder has not caught up yet.
+            delay = 5
+        after(max(1, delay), poll)
+
+    cv2.namedWindow(window)
+    cv2.createTrackbar("Frame", window, 0, max(player.frame_total - 1, 1), on_trackbar)
+    poll()
@@ -0,0 +1,132 @@
+import itertools
+import cv2
+import numpy as np
+from core.converter import CHANNELS
+
+CHANNEL_MODES = ("all", "gray") + tuple(name for name, _ in CHANNELS)
+
+def parse_roi(text):
+    # "x,y,w,h" in pixels of the camera frame, or empty for the full frame.
+    text = (text or "").strip()
+    if not text:
+        return None
+    parts = [part.strip() for part in text.split(",")]
+    if len(parts) != 4 or not all(part.isdigit() for part in parts):
+        raise ValueError(f"ROI must be x,y,w,h in pixels, got '{text}'")
+    return tuple(int(part) for part in parts)
+
+class FramePreprocessor:
+    # Reduces each camera frame before it reaches the ring buffer: ROI crop,
+    # channel selection or grayscale, NxN binning and averaging of every
+    # `average` consecutive frames, in that order. Binning is an INTER_AREA
+    # resize by an integer factor, i.e. the exact mean of each block, which
+    # OpenCV computes far faster than a NumPy reduction. Averaging
+    # accumulates into a reused uint32 buffer and rounds back, so the stored
+    # frames keep the camera's dtype at a fraction of the size.
+    def __init__(self, roi=None, binning=1, channel="all", average=1):
+        if channel not in CHANNEL_MODES:
+            raise ValueError(f"Unknown channel mode: {channel}")
+        self.roi = tuple(roi) if roi else None
+        self.binning = max(1, int(binning))
+        self.channel = channel
+        self.average = max(1, int(average))
+        self.input_shape = None
+        self.output_shape = None
+        self._single = None
+        self._binned = None
+        self._acc = None
+        self._pending = 0
+
+    @property
+    def identity(self):
+        return self.roi is None and self.binning == 1 and self.channel == "all" and self.average == 1
+
+    def _crop(self, frame):
+        if self.roi is None:
+            return frame
+        x, y, w, h = self.roi
+        if x + w > frame.shape[1] or y + h > frame.shape[0]:
+            raise ValueError(f"ROI {self.roi} exceeds the {frame.shape[1]}x{frame.shape[0]} frame")
+        return frame[y:y + h, x:x + w]
+
+    def _select(self, view):
+        if self.channel == "all" or view.ndim == 2:
+            return view
+        if self._single is None:
+            self._single = np.empty(view.shape[:2], dtype=view.dtype)
+        if self.channel == "gray":
+            return cv2.cvtColor(view, cv2.COLOR_BGR2GRAY, dst=self._single)
+        return cv2.extractChannel(view, dict(CHANNELS)[self.channel], dst=self._single)
+
+    def prepare(self, frame_shape):
+        # Output shape for frames of frame_shape; called once with the first
+        # frame so buffers are allocated up front.
+        self.input_shape = tuple(frame_shape)
+        h, w = frame_shape[:2]
+        if self.roi is not None:
+            w, h = self.roi[2], self.roi[3]
+        h, w = h // self.binning, w // self.binning
+        if h == 0 or w == 0:
+            raise ValueError(f"Binning {self.binning} leaves no pixels of the {self.input_shape} frame")
+        keeps_color = self.channel == "all" and len(frame_shape) == 3
+        self.output_shape = (h, w) + (tuple(frame_shape[2:]) if keeps_color else ())
+        if self.average > 1:
+            self._acc = np.zeros(self.output_shape, dtype=np.uint32)
+            if self.binning > 1:
+                self._binned = np.empty(self.output_shape, dtype=np.uint8)
+        return self.output_shape
+
+    def process(self, frame, out):
+        # Writes into out and returns True once it holds a finished frame;
+        # with averaging that is every `average`-th call.
+        if self.output_shape is None:
+            self.prepare(frame.shape)
+        view = self._select(self._crop(frame))
+        n = self.binning
+        if n > 1:
+            h, w = self.output_shape[:2]
+            target = out if self._acc is None else self._binned
+            view = cv2.resize(view[:h * n, :w * n], (w, h), dst=target, interpolation=cv2.INTER_AREA)
+        if self._acc is None:
+            if view is not out:
+                out[...] = view
+            return True
+        self._acc += view
+        self._pending += 1
+        if self._pending < self.average:
+            return False
+        self._acc += self.average // 2
+        self._acc //= self.average
+        out[...] = self._acc
+        self._acc[...] = 0
+        self._pending = 0
+        return True
+
+    def apply(self, frames):
+        # Offline version over a sequence of frames; returns an
+        # (M, *output_shape) array with M = len(frames) // average.
+        frames = iter(frames)
+        first = next(frames, None)
+        if first is None:
+            return np.empty((0,), dtype=np.uint8)
+        self.prepare(first.shape)
+        results = []
+        out = np.empty(self.output_shape, dtype=first.dtype)
+        for frame in itertools.chain([first], frames):
+            if self.process(frame, out):
+                results.append(out.copy())
+        return np.stack(results) if results else np.empty((0,) + self.output_shape, dtype=first.dtype)
+
+    def describe(self):
+        info = {
+            "roi": list(self.roi) if self.roi else None,
+            "binning": self.binning,
+            "channel": self.channel,
+            "average": self.average,
+            "input_shape": list(self.input_shape) if self.input_shape else None,
+            "output_shape": list(self.output_shape) if self.output_shape else None,
+        }
+        if self.input_shape and self.output_shape:
+            # Bytes stored per camera frame read, relative to the raw frame.
+            info["size_ratio"] = float(np.prod(self.output_shape)) / float(np.prod(self.input_shape)) / self.average
+        return info
@@ -0,0 +1,101 @@
+import threading
+import time
+import cv2
+
+PREVIEW_SCALES = {"1": 1.0, "1/2": 0.5, "1/4": 0.25}
+
+class LivePreview:
+    # Handler for a live pipeline stage that renders at most max_hz frames
+    # per second, downscaled by scale, into a latest-frame slot. Frames
+    # arriving between refreshes return straight away, so with a DROP_OLDEST
+    # queue the preview never holds up capture however slow the display is.
+    # HighGUI is not thread-safe (and on macOS only works on the main
+    # thread), so the window is only touched by show() and close(), which
+    # the main loop calls; on_key receives each key press there.
+    def __init__(self, window, pipeline, max_hz=15, scale=0.5, overlay=True, on_key=None):
+        self.window = window
+        self.pipeline = pipeline
+        self.interval = 1.0 / max_hz if max_hz else 0.0
+        self.scale = scale
+        self.overlay = overlay
+        self.on_key = on_key
+        self.shown = 0
+        self.skipped = 0
+        self._next_show = 0.0
+        self._latest = None
+        self._lock = threading.Lock()
+        self._opened = False
+        self._fps = 0.0
+        self._fps_mark = None
+
+    def _capture_fps(self, now):
+        # Capture rate over the last ~0.5 s, from the capture stage counter.
+        processed = self.pipeline.capture_counters.processed
+        if self._fps_mark is None:
+            self._fps_mark = (now, processed)
+        elif now - self._fps_mark[0] >= 0.5:
+            self._fps = (processed - self._fps_mark[1]) / (now - self._fps_mark[0])
+            self._fps_mark = (now, processed)
+        return self._fps
+
+    def _draw_overlay(self, image, now):
+        depths = "  ".join(f"{stage.stage_name}:{stage.depth()}" for stage in self.pipeline.stages if not stage.live)
+        lines = [f"{self._capture_fps(now):.1f} fps", f"queue {depths}"]
+        if self.pipeline.armed:
+            lines.append("ARMED")
+        for row, text in enumerate(lines):
+            y = 18 + row * 18
+            cv2.putText(image, text, (6, y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 3, cv2.LINE_AA)
+            cv2.putText(image, text, (6, y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 1, cv2.LINE_AA)
+
+    def __call__(self, index, timestamp, frame):
+        now = time.monotonic()
+        if now < self._next_show:
+            self.skipped += 1
+            return
+        # Keep a steady cadence, but restart it after a long stall rather
+        # than showing a burst of frames.
+        if now - self._next_show > self.interval:
+            self._next_show = now
+        self._next_show += self.interval
+        if self.scale != 1.0:
+            # INTER_AREA avoids aliasing.
+            size = (max(1, int(frame.shape[1] * self.scale)), max(1, int(frame.shape[0] * self.scale)))
+            image = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        else:
+            # The frame is a ring-buffer slot shared with the storage stages
+            # and is only shown after this returns, so the slot gets a copy.
+            image = frame.copy()
+        if self.overlay:
+            self._draw_overlay(image, now)
+        with self._lock:
+            if self._latest is not None:
+                self.skipped += 1
+            self._latest = image
+
+    def show(self, delay=1):
+        # Main thread only: shows the newest rendered frame, if any, and
+        # polls the keyboard. Returns True if a frame was shown.
+        with self._lock:
+            image, self._latest = self._latest, None
+        if image is not None:
+            cv2.imshow(self.window, image)
+            self._opened = True
+            self.shown += 1
+        if self._opened:
+            key = cv2.waitKey(delay) & 0xFF
+            if key != 0xFF and self.on_key is not None:
+                self.on_key(key)
+        return image is not None
+
+    def close(self):
+        # Main thread only, once the pipeline has joined.
+        with self._lock:
+            self._latest = None
+        if self._opened:
+            cv2.destroyWindow(self.window)
+            self._opened = False
+
+    def stats(self):
+        return {"shown": self.shown, "skipped": self.skipped,
+                "max_hz": 1.0 / self.interval if self.interval else None, "scale": self.scale}
@@ -0,0 +1,166 @@
+import ast
+import json
+import os
+import struct
+import numpy as np
+
+# Fixed-size .npy header (format version 1.0), padded so it can be rewritten
+# in place as the frame count grows without moving any frame data.
+HEADER_BYTES = 256
+_MAGIC = b'\x93NUMPY\x01\x00'
+
+def sidecar_path(raw_file):
+    return os.path.splitext(raw_file)[0] + "_raw.json"
+
+def _npy_header(shape, dtype):
+    header = repr({'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)),
+                   'fortran_order': False, 'shape': tuple(shape)})
+    length = HEADER_BYTES - len(_MAGIC) - 2
+    if len(header) + 1 > length:
+        raise ValueError(f"Frame shape {tuple(shape)} does not fit in the raw header")
+    return _MAGIC + struct.pack('<H', length) + header.ljust(length - 1).encode('latin1') + b'\n'
+
+def _read_header(raw_file):
+    with open(raw_file, 'rb') as f:
+        head = f.read(HEADER_BYTES)
+    if len(head) < HEADER_BYTES or not head.startswith(_MAGIC):
+        raise ValueError(f"Not a raw frame file: {raw_file}")
+    length = struct.unpack('<H', head[8:10])[0]
+    return ast.literal_eval(head[10:10 + length].decode('latin1'))
+
+# Per-frame timestamp columns of the raw sidecar and the HDF5 'timestamps'
+# dataset. frame_index is the recorded frame number of the stored frame: a
+# DROP_OLDEST storage stage can skip some, and it is the row to look up in
+# the per-frame tables (frame_stats, stage_latency_ms).
+TIMESTAMP_COLUMNS = ("monotonic_s", "pos_msec", "frame_index")
+
+def _write_sidecar(raw_file, frame_count, frame_shape, dtype, fps, timestamps=None):
+    info = {
+        "frame_count": frame_count,
+        "frame_shape": list(frame_shape),
+        "dtype": np.dtype(dtype).str,
+        "header_bytes": HEADER_BYTES,
+        "fps": fps,
+        "timestamp_columns": list(TIMESTAMP_COLUMNS),
+    }
+    if timestamps is not None:
+        info["timestamps"] = timestamps
+    # Replaced atomically, so a reader never sees a half-written sidecar.
+    tmp = sidecar_path(raw_file) + ".tmp"
+    with open(tmp, 'w') as f:
+        json.dump(info, f)
+    os.replace(tmp, sidecar_path(raw_file))
+
+class RawFrameWriter:
+    # Appends frames uncompressed to a .npy file whose header and sidecar JSON
+    # are rewritten every sync_every frames and on close, so the file can be
+    # memory-mapped (np.load(mmap_mode='r') or load_raw) while capture runs.
+    # Timestamps only go into the sidecar on close, to keep syncs cheap.
+    def __init__(self, filename, fps=None, sync_every=64):
+        self.filename = filename
+        self.fps = fps
+        self.sync_every = max(1, int(sync_every))
+        self.frame_count = 0
+        self.frame_shape = None
+        self.dtype = None
+        self.timestamps = []
+        self._file = open(filename, 'wb')
+        self._unsynced = 0
+
+    def append(self, frame, timestamp=None):
+        # timestamp is an optional (monotonic seconds, CAP_PROP_POS_MSEC
+        # [, frame index]) tuple, as for HDF5FrameWriter.append.
+        if self.frame_shape is None:
+            self.frame_shape = frame.shape
+            self.dtype = frame.dtype
+            self._file.write(_npy_header((0,) + frame.shape, frame.dtype))
+        elif frame.shape != self.frame_shape:
+            raise ValueError(f"Frame shape {frame.shape} does not match {self.frame_shape}")
+        self._file.write(np.ascontiguousarray(frame, dtype=self.dtype).data)
+        self.timestamps.append(tuple(timestamp) if timestamp is not None else ())
+        self.frame_count += 1
+        self._unsynced += 1
+        if self._unsynced >= self.sync_every:
+            self.flush()
+
+    def extend(self, frames):
+        for frame in frames:
+            self.append(frame)
+
+    def flush(self, final=False):
+        if self.frame_shape is None:
+            return
+        self._file.flush()
+        end = self._file.tell()
+        self._file.seek(0)
+        self._file.write(_npy_header((self.frame_count,) + self.frame_shape, self.dtype))
+        self._file.seek(end)
+        self._file.flush()
+        self._write_sidecar(final)
+        self._unsynced = 0
+
+    def _write_sidecar(self, final):
+        _write_sidecar(self.filename, self.frame_count, self.frame_shape, self.dtype, self.fps,
+                       self.timestamps if final else None)
+
+    def close(self):
+        if self._file is None:
+            return
+        self.flush(final=True)
+        self._file.close()
+        self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+def save_frames_to_raw(frames, filename, fps=None):
+    with RawFrameWriter(filename, fps=fps) as writer:
+        writer.extend(frames)
+
+def create_raw(raw_file, frame_count, frame_shape, dtype, fps=None, timestamps=None):
+    # Preallocates a raw file for frame_count frames and returns a writable
+    # memmap over it, for filling in bulk (e.g. from HDF5) rather than
+    # appending frame by frame.
+    frame_shape = tuple(frame_shape)
+    with open(raw_file, 'wb') as f:
+        f.write(_npy_header((frame_count,) + frame_shape, dtype))
+        f.truncate(HEADER_BYTES + frame_count * int(np.prod(frame_shape)) * np.dtype(dtype).itemsize)
+    _write_sidecar(raw_file, frame_count, frame_shape, dtype, fps, timestamps)
+    if frame_count == 0:
+        return np.empty((0,) + frame_shape, dtype=dtype)
+    return np.memmap(raw_file, dtype=dtype, mode='r+', offset=HEADER_BYTES, shape=(frame_count,) + frame_shape)
+
+def load_sidecar(raw_file):
+    path = sidecar_path(raw_file)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def load_raw(raw_file, mode='r'):
+    # Returns (frames, info): frames is an np.memmap of shape (N, H, W, C) and
+    # info the sidecar dict. N is taken from the file size rather than the
+    # header, so a file that is still being written (or was cut off) maps
+    # every complete frame on disk.
+    header = _read_header(raw_file)
+    dtype = np.dtype(header['descr'])
+    frame_shape = tuple(header['shape'][1:])
+    frame_bytes = int(np.prod(frame_shape)) * dtype.itemsize
+    count = (os.path.getsize(raw_file) - HEADER_BYTES) // frame_bytes if frame_bytes else 0
+    info = load_sidecar(raw_file)
+    if count == 0:
+        return np.empty((0,) + frame_shape, dtype=dtype), info
+    frames = np.memmap(raw_file, dtype=dtype, mode=mode, offset=HEADER_BYTES, shape=(count,) + frame_shape)
+    return frames, info
+
+def raw_timestamps(info):
+    # Sidecar timestamps as an (N, len(TIMESTAMP_COLUMNS)) float array, NaN
+    # where none was given (including frame_index in older sidecars).
+    rows = info.get("timestamps") or []
+    table = np.full((len(rows), len(TIMESTAMP_COLUMNS)), np.nan)
+    for i, row in enumerate(rows):
+        table[i, :len(row)] = [np.nan if v is None else v for v in row]
+    return table
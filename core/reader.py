@@ -0,0 +1,137 @@
+import queue
+import threading
+from collections import OrderedDict
+import h5py
+import numpy as np
+
+class HDF5FrameReader:
+    # Random access to a frame dataset that decodes whole HDF5 chunks on
+    # demand, keeps the most recent ones in an LRU cache bounded by
+    # cache_bytes, and prefetches chunks ahead in the direction of travel.
+    def __init__(self, filename, dataset='video', cache_bytes=256 * 1024 * 1024, prefetch=2):
+        self.filename = filename
+        self._file = h5py.File(filename, 'r')
+        self._dataset = self._file[dataset]
+        self.shape = self._dataset.shape
+        self.dtype = self._dataset.dtype
+        chunks = self._dataset.chunks
+        self.chunk_frames = chunks[0] if chunks else 1
+        chunk_bytes = max(1, self.chunk_frames * int(np.prod(self.shape[1:])) * self.dtype.itemsize)
+        self.max_chunks = max(2, cache_bytes // chunk_bytes)
+        self.prefetch = prefetch
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_index = None
+        self._requests = queue.Queue()
+        self._worker = None
+        if prefetch > 0:
+            self._worker = threading.Thread(target=self._prefetch_loop, daemon=True)
+            self._worker.start()
+
+    def __len__(self):
+        return self.shape[0]
+
+    def _chunk_count(self):
+        return (len(self) + self.chunk_frames - 1) // self.chunk_frames
+
+    def _load_chunk(self, chunk):
+        with self._lock:
+            data = self._cache.get(chunk)
+            if data is not None:
+                self._cache.move_to_end(chunk)
+                return data, True
+        start = chunk * self.chunk_frames
+        data = self._dataset[start:min(start + self.chunk_frames, len(self))]
+        with self._lock:
+            self._cache[chunk] = data
+            self._cache.move_to_end(chunk)
+            while len(self._cache) > self.max_chunks:
+                self._cache.popitem(last=False)
+        return data, False
+
+    def _prefetch_loop(self):
+        while True:
+            chunk = self._requests.get()
+            if chunk is None:
+                break
+            try:
+                self._load_chunk(chunk)
+            except Exception:
+                # Prefetch is best effort; a real read will surface the error.
+                pass
+
+    def _schedule_prefetch(self, chunk, direction):
+        if self._worker is None:
+            return
+        # Drop stale requests so a fast scrub does not queue up old chunks.
+        while True:
+            try:
+                self._requests.get_nowait()
+            except queue.Empty:
+                break
+        for step in range(1, self.prefetch + 1):
+            ahead = chunk + direction * step
+            if 0 <= ahead < self._chunk_count():
+                with self._lock:
+                    cached = ahead in self._cache
+                if not cached:
+                    self._requests.put(ahead)
+
+    def frame(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f"Frame {index} out of range for {len(self)} frames")
+        chunk = index // self.chunk_frames
+        data, hit = self._load_chunk(chunk)
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        direction = -1 if self._last_index is not None and index < self._last_index else 1
+        self._last_index = index
+        self._schedule_prefetch(chunk, direction)
+        return data[index - chunk * self.chunk_frames]
+
+    def frames(self, start, stop):
+        start, stop, _ = slice(start, stop).indices(len(self))
+        if stop <= start:
+            return np.empty((0,) + self.shape[1:], dtype=self.dtype)
+        out = np.empty((stop - start,) + self.shape[1:], dtype=self.dtype)
+        for chunk in range(start // self.chunk_frames, (stop - 1) // self.chunk_frames + 1):
+            data, _ = self._load_chunk(chunk)
+            chunk_start = chunk * self.chunk_frames
+            lo = max(start, chunk_start)
+            hi = min(stop, chunk_start + len(data))
+            out[lo - start:hi - start] = data[lo - chunk_start:hi - chunk_start]
+        return out
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step == 1:
+                return self.frames(start, stop)
+            indices = range(start, stop, step)
+            if not indices:
+                return np.empty((0,) + self.shape[1:], dtype=self.dtype)
+            return np.stack([self.frame(i) for i in indices])
+        return self.frame(int(key))
+
+    def close(self):
+        if self._worker is not None:
+            self._requests.put(None)
+            self._worker.join()
+            self._worker = None
+        with self._lock:
+            self._cache.clear()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,106 @@
+import os
+import platform
+from core import converter, instrument, metadata, rawstore
+from core.catalog import get_catalog, DEFAULT_DB_PATH
+from core.encoder import VideoEncoder
+from core.framestats import FrameStats
+
+def add_storage_stages(pipeline, video_file, hdf5_file, fps, codec="gzip", chunks=None,
+                       fourcc="XVID", segment_frames=None, raw_file=None, frame_stats=True):
+    # AVI encoding and HDF5 writing as two pipeline stages, both consuming
+    # frames while capture runs, plus an uncompressed memory-mappable copy
+    # when raw_file is given and a per-frame statistics stage unless
+    # frame_stats is False. Returns (encoder, writer) so callers can inspect
+    # them after the pipeline has joined.
+    encoder = VideoEncoder(video_file, fps, fourcc=fourcc, segment_frames=segment_frames)
+    writer = converter.HDF5FrameWriter(hdf5_file, codec=codec, chunks=chunks, fps=fps)
+
+    def store_frame(index, timestamp, frame):
+        writer.append(frame, timestamp=(timestamp, pipeline.device_times[index], index))
+
+    def close_writer():
+        writer.close()
+        # A stream that stored no frames (e.g. gated throughout) leaves no
+        # .h5 behind to be taken for a recording; the AVI is only opened on
+        # the first frame anyway.
+        if writer.frame_count == 0:
+            os.remove(hdf5_file)
+
+    pipeline.add_stage("encode", lambda index, timestamp, frame: encoder.write(frame), on_close=encoder.close)
+    pipeline.add_stage("hdf5", store_frame, on_close=close_writer)
+    if raw_file:
+        raw_writer = rawstore.RawFrameWriter(raw_file, fps=fps)
+
+        def store_raw(index, timestamp, frame):
+            raw_writer.append(frame, timestamp=(timestamp, pipeline.device_times[index], index))
+
+        def close_raw():
+            raw_writer.close()
+            if raw_writer.frame_count == 0:
+                for path in (raw_file, rawstore.sidecar_path(raw_file)):
+                    if os.path.exists(path):
+                        os.remove(path)
+
+        pipeline.add_stage("raw", store_raw, on_close=close_raw)
+    if frame_stats:
+        pipeline.frame_stats = FrameStats(pipeline.total_frames + pipeline.pretrigger_frames)
+        pipeline.add_stage("stats", pipeline.frame_stats)
+    return encoder, writer
+
+def stream_file_base(file_base, label, multi):
+    # Single-camera sessions keep the plain file base; each stream of a
+    # multi-camera session gets a BIDS acq- entity.
+    return f"{file_base}_acq-{label}" if multi else file_base
+
+def finalize_stream(file_base, subject_id, session_id, task_type, frame_count, camera_settings, pipeline,
+                    channels=None, db_path=DEFAULT_DB_PATH, extra_metadata=None):
+    # channels is None, "jpeg" or "hdf5". The conversion and database steps
+    # are timed into the pipeline's metrics alongside the capture stages.
+    hdf5_file = file_base + ".h5"
+    catalog = get_catalog(db_path)
+    preprocessor = pipeline.preprocessor
+    if preprocessor is not None and len(preprocessor.output_shape or ()) != 3:
+        # Grayscale or single-channel recordings have no colour channels to split.
+        channels = None
+    with instrument.collecting(pipeline.metrics):
+        if channels == "hdf5":
+            converter.save_channels_to_hdf5(hdf5_file)
+        elif channels == "jpeg":
+            converter.split_and_save_channels(converter.iter_hdf5_frames(hdf5_file), file_base + "_channels")
+        stage_names, latency = pipeline.latency_table()
+        if stage_names:
+            converter.write_frame_table(hdf5_file, "stage_latency_ms", latency, stage_names)
+        stats_summary = None
+        if pipeline.frame_stats is not None and pipeline.frame_stats.values is not None:
+            converter.write_frame_table(hdf5_file, "frame_stats", pipeline.frame_stats.table(frame_count),
+                                        pipeline.frame_stats.columns)
+            stats_summary = pipeline.frame_stats.summary(frame_count)
+        activity = pipeline.activity()
+        if activity is not None:
+            # Times are stored relative to the first recorded frame.
+            origin = pipeline.monotonic_times[0] if frame_count else 0.0
+            activity["scores"][:, 0] -= origin
+            activity["epochs"][:, 2:4] -= origin
+            converter.write_frame_table(hdf5_file, "activity_scores", activity["scores"], activity["score_columns"])
+            converter.write_frame_table(hdf5_file, "activity_epochs", activity["epochs"], activity["epoch_columns"])
+
+        meta = metadata.generate_metadata(subject_id, session_id, frame_count, camera_settings,
+                                          pipeline_stats=pipeline.stats(), timing=pipeline.timing())
+        meta.update(extra_metadata or {})
+        meta["rig"] = platform.node()
+        if stats_summary is not None:
+            meta["frame_stats"] = stats_summary
+        if preprocessor is not None:
+            meta["preprocess"] = preprocessor.describe()
+        if pipeline.profiles is not None:
+            profile_file = file_base + "_profile.prof"
+            meta["profile"] = {"file": os.path.basename(profile_file), "top": pipeline.profiles.dump(profile_file)}
+        row_id = catalog.insert_session(subject_id, session_id, meta['timestamp'], frame_count, file_base, task_type)
+        meta["stage_metrics"] = pipeline.metrics.summary()
+        metadata.save_metadata_to_json(meta, file_base + "_metadata.json")
+    catalog.insert_stage_metrics(row_id, meta["rig"], meta["stage_metrics"])
+    if activity is not None:
+        catalog.insert_activity_epochs(row_id, activity["epochs"])
+    if stats_summary:
+        catalog.insert_frame_stats(row_id, stats_summary)
+    return meta
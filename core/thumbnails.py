@@ -0,0 +1,198 @@
+import cv2
+import h5py
+import numpy as np
+from core.instrument import timed
+
+# Downsampled copies of 'video' are stored under PYRAMID_GROUP as level_2,
+# level_4 and level_8, plus a sparse strip of KEYFRAME_WIDTH-pixel wide
+# thumbnails, one every KEYFRAME_INTERVAL frames, for timelines.
+PYRAMID_GROUP = "pyramid"
+PYRAMID_FACTORS = (2, 4, 8)
+KEYFRAME_INTERVAL = 64
+KEYFRAME_WIDTH = 96
+# Small levels pack several frames per chunk so sequential reads stay cheap.
+CHUNK_BYTES = 1 << 20
+
+def _chunk_frames(frame_shape, dtype, limit):
+    frame_bytes = int(np.prod(frame_shape)) * np.dtype(dtype).itemsize
+    return max(1, min(limit, CHUNK_BYTES // max(1, frame_bytes)))
+
+def _resize_into(src, dst):
+    cv2.resize(src, (dst.shape[1], dst.shape[0]), dst=dst, interpolation=cv2.INTER_AREA)
+
+class PyramidBuilder:
+    # Appends batches of frames to the pyramid of an open HDF5 file. Each
+    # level is an INTER_AREA resize of the level above it rather than of the
+    # full frame, so all of them together cost less than one full-size
+    # resize. Any earlier pyramid in the file is replaced.
+    def __init__(self, h5file, frame_shape, dtype, factors=PYRAMID_FACTORS, keyframe_interval=KEYFRAME_INTERVAL,
+                 keyframe_width=KEYFRAME_WIDTH, batch_size=8, **dataset_options):
+        frame_shape = tuple(frame_shape)
+        h, w = frame_shape[:2]
+        extra = frame_shape[2:]
+        if PYRAMID_GROUP in h5file:
+            del h5file[PYRAMID_GROUP]
+        self._group = group = h5file.create_group(PYRAMID_GROUP)
+        self.keyframe_interval = max(1, int(keyframe_interval))
+        self.frame_count = 0
+        self.levels = []
+        for factor in sorted(set(factors)):
+            shape = (h // factor, w // factor) + extra
+            if shape[0] < 1 or shape[1] < 1:
+                break
+            dataset = group.create_dataset(
+                f"level_{factor}", shape=(0,) + shape, maxshape=(None,) + shape, dtype=dtype,
+                chunks=(_chunk_frames(shape, dtype, 64),) + shape, **dataset_options,
+            )
+            dataset.attrs['factor'] = factor
+            self.levels.append((dataset, np.empty((batch_size,) + shape, dtype=dtype)))
+
+        key_w = min(keyframe_width, w)
+        key_shape = (max(1, round(h * key_w / w)), key_w) + extra
+        self.keyframes = group.create_dataset(
+            "keyframes", shape=(0,) + key_shape, maxshape=(None,) + key_shape, dtype=dtype,
+            chunks=(_chunk_frames(key_shape, dtype, 256),) + key_shape, **dataset_options,
+        )
+        self.keyframe_index = group.create_dataset("keyframe_index", shape=(0,), maxshape=(None,),
+                                                   dtype='i8', chunks=(1024,))
+        group.attrs['keyframe_interval'] = self.keyframe_interval
+        self._key = np.empty(key_shape, dtype=dtype)
+        # Keyframes are resized from the smallest level still wider than them.
+        self._key_source = None
+        for level, (dataset, _) in enumerate(self.levels):
+            if dataset.shape[2] >= key_w:
+                self._key_source = level
+
+    @timed("thumbnails.pyramid")
+    def extend(self, frames):
+        # frames is an (n, *frame_shape) array with n <= batch_size.
+        n = len(frames)
+        if n == 0:
+            return
+        start = self.frame_count
+        end = start + n
+        for i in range(n):
+            src = frames[i]
+            for _, buffer in self.levels:
+                _resize_into(src, buffer[i])
+                src = buffer[i]
+        for dataset, buffer in self.levels:
+            dataset.resize(end, axis=0)
+            dataset[start:end] = buffer[:n]
+
+        interval = self.keyframe_interval
+        keys = range(-(-start // interval) * interval, end, interval)
+        if keys:
+            count = self.keyframe_index.shape[0]
+            self.keyframes.resize(count + len(keys), axis=0)
+            self.keyframe_index.resize(count + len(keys), axis=0)
+            source = frames if self._key_source is None else self.levels[self._key_source][1]
+            for j, index in enumerate(keys):
+                _resize_into(source[index - start], self._key)
+                self.keyframes[count + j] = self._key
+            self.keyframe_index[count:] = np.asarray(keys, dtype=np.int64)
+        self.frame_count = end
+        self._group.attrs['frame_count'] = end
+
+def _complete_pyramid(f):
+    # The pyramid group of an open file if it covers every frame; a pyramid
+    # cut short by a crash is ignored rather than half used.
+    group = f.get(PYRAMID_GROUP)
+    if group is None or 'video' not in f or group.attrs.get('frame_count') != f['video'].shape[0]:
+        return None
+    return group
+
+def pyramid_levels(f):
+    # {factor: dataset name} of the stored levels in an open file.
+    group = _complete_pyramid(f)
+    if group is None:
+        return {}
+    return {int(group[name].attrs['factor']): f"{PYRAMID_GROUP}/{name}"
+            for name in group if name.startswith("level_")}
+
+def has_pyramid(hdf5_file):
+    with h5py.File(hdf5_file, 'r') as f:
+        return _complete_pyramid(f) is not None
+
+def pick_level(f, width=None, height=None, scale=None):
+    # Name of the smallest stored level that is still at least width x
+    # height (or scale times the frame size), falling back to 'video'.
+    h, w = f['video'].shape[1:3]
+    if scale is not None:
+        width, height = int(w * scale), int(h * scale)
+    if width is None and height is None:
+        return 'video'
+    best = 'video'
+    for factor, name in sorted(pyramid_levels(f).items()):
+        level_h, level_w = f[name].shape[1:3]
+        if (width is None or level_w >= width) and (height is None or level_h >= height):
+            best = name
+    return best
+
+def build_pyramid(hdf5_file, factors=PYRAMID_FACTORS, keyframe_interval=KEYFRAME_INTERVAL, batch_size=64):
+    # Adds (or rebuilds) the pyramid of an existing recording, with the
+    # same compression as its 'video' dataset.
+    with h5py.File(hdf5_file, 'a') as f:
+        video = f['video']
+        builder = PyramidBuilder(f, video.shape[1:], video.dtype, factors, keyframe_interval,
+                                 batch_size=batch_size, compression=video.compression,
+                                 compression_opts=video.compression_opts, shuffle=video.shuffle)
+        for start in range(0, video.shape[0], batch_size):
+            builder.extend(video[start:start + batch_size])
+        return builder.frame_count
+
+def keyframes(hdf5_file, count=None):
+    # (frame indices, thumbnails) for up to count evenly spaced keyframes.
+    # Recordings without a pyramid fall back to sampling 'video', which
+    # reads one full frame per thumbnail.
+    with h5py.File(hdf5_file, 'r') as f:
+        total = f['video'].shape[0]
+        if total == 0:
+            return np.empty((0,), dtype=np.int64), None
+        group = _complete_pyramid(f)
+        if group is not None:
+            index = group['keyframe_index'][()]
+            positions = np.arange(len(index))
+            if count is not None and count < len(index):
+                positions = np.unique(np.linspace(0, len(index) - 1, count).round().astype(np.int64))
+            return index[positions], group['keyframes'][positions.tolist()]
+        video = f['video']
+        h, w = video.shape[1:3]
+        key_w = min(KEYFRAME_WIDTH, w)
+        key_shape = (max(1, round(h * key_w / w)), key_w) + video.shape[3:]
+        index = np.arange(0, total, KEYFRAME_INTERVAL)
+        if count is not None and count < len(index):
+            index = np.unique(np.linspace(0, total - 1, count).round().astype(np.int64))
+        thumbs = np.empty((len(index),) + key_shape, dtype=video.dtype)
+        for j, i in enumerate(index):
+            _resize_into(video[i], thumbs[j])
+        return index, thumbs
+
+def timeline_image(hdf5_file, width=1280, rows=4):
+    # A grid of up to rows lines of evenly spaced keyframes, labelled with
+    # their frame numbers, as a BGR image about width pixels wide. Returns
+    # (image, frame indices, columns); image is None for an empty file,
+    # including one without a 'video' dataset.
+    with h5py.File(hdf5_file, 'r') as f:
+        if 'video' not in f:
+            return None, np.empty((0,), dtype=np.int64), 1
+        h, w = f['video'].shape[1:3]
+    key_w = min(KEYFRAME_WIDTH, w)
+    columns = max(1, width // key_w)
+    index, thumbs = keyframes(hdf5_file, columns * rows)
+    if thumbs is None:
+        return None, index, columns
+    if thumbs.ndim == 3:
+        thumbs = np.repeat(thumbs[..., None], 3, axis=3)
+    elif thumbs.shape[3] == 1:
+        thumbs = np.repeat(thumbs, 3, axis=3)
+    tile_h, tile_w = thumbs.shape[1:3]
+    columns = min(columns, len(thumbs))
+    rows = -(-len(thumbs) // columns)
+    image = np.zeros((rows * tile_h, columns * tile_w, 3), dtype=np.uint8)
+    for j, (frame_index, thumb) in enumerate(zip(index, thumbs)):
+        y, x = (j // columns) * tile_h, (j % columns) * tile_w
+        image[y:y + tile_h, x:x + tile_w] = thumb
+        cv2.putText(image, str(frame_index), (x + 2, y + tile_h - 4), cv2.FONT_HERSHEY_SIMPLEX, 0.35,
+                    (0, 255, 255), 1, cv2.LINE_AA)
+    return image, index, columns
@@ -0,0 +1,33 @@
+import os
+import h5py
+import numpy as np
+import pytest
+from core import batch, cli
+
+def _record(extra=()):
+    cli.main(["record", "--camera", "synthetic", "--subject", "01", "--session", "01", "--frames", "20",
+              "--fps", "30", "--output", "data", "--video-codec", "MJPG", *extra])
+    file_base = os.path.join("data", "sub-01", "ses-01", "func", "video")
+    # As after a copy without -p: the AVI looks newer than the .h5.
+    later = os.path.getmtime(file_base + ".h5") + 60
+    os.utime(file_base + ".avi", (later, later))
+    return file_base
+
+def _contents(hdf5_file):
+    with h5py.File(hdf5_file, 'r') as f:
+        return {name: f[name][()] for name in f if isinstance(f[name], h5py.Dataset)}
+
+@pytest.mark.parametrize("extra", [["--channels", "hdf5"], ["--channel", "gray", "--bin", "2"]])
+def test_reexport_keeps_capture_hdf5(tmp_path, monkeypatch, extra):
+    monkeypatch.chdir(tmp_path)
+    file_base = _record(extra)
+    before = _contents(file_base + ".h5")
+    assert {"video", "timestamps", "frame_stats", "stage_latency_ms"} <= set(before)
+
+    results, errors = batch.reexport_tree("data", workers=1, channels="hdf5", force=True, db_path="recordings.db")
+    assert not errors
+    assert "hdf5" not in results[0]["steps"]
+    after = _contents(file_base + ".h5")
+    assert set(after) == set(before)
+    for name, data in before.items():
+        np.testing.assert_array_equal(after[name], data)
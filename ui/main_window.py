@@ -1,17 +1,23 @@
 import os
-import cv2
 import time
 import tkinter as tk
 from tkinter import filedialog, ttk
 from tkinter import messagebox
-from core import camera, metadata, converter, database
+from core import camera, converter, calibration, recording, playback, rawstore
+from core.preview import LivePreview, PREVIEW_SCALES
+from core.preprocess import CHANNEL_MODES as PREPROCESS_CHANNELS, parse_roi
+from core.gating import ActivityGate
+from core.catalog import get_catalog, DEFAULT_DB_PATH, SESSION_COLUMNS
+from core.discovery import CameraDiscovery, device_label
+from core.encoder import FOURCCS
+from core.multicam import MultiCameraRecorder
+from core.pipeline import POLICIES, BLOCK, DROP_OLDEST
 import subprocess
 import platform
 import json
-import sqlite3
+import threading
 
 def launch_app():
-    frames = []
     frame_count = 0
     def open_folder(path):
         if platform.system() == "Windows":
@@ -25,20 +31,10 @@ def launch_app():
         file_path = filedialog.askopenfilename(filetypes=[("AVI Video", "*.avi")])
         if not file_path:
             return
-        cap = cv2.VideoCapture(file_path)
-        if not cap.isOpened():
+        try:
+            playback.preview_avi(file_path, root.after)
+        except RuntimeError:
             messagebox.showerror("Error", "Failed to open video file.")
-            return
-        while cap.isOpened():
-            ret, frame = cap.read()
-            if not ret:
-                break
-            cv2.imshow("AVI Preview", frame)
-            key = cv2.waitKey(30)
-            if key == ord('q') or cv2.getWindowProperty("AVI Preview", cv2.WND_PROP_VISIBLE) < 1:
-                break
-        cap.release()
-        cv2.destroyAllWindows()
 
     def view_json_metadata():
         file_path = filedialog.askopenfilename(filetypes=[("JSON Files", "*.json")])
@@ -53,25 +49,97 @@ def launch_app():
         text.pack(expand=True, fill="both")
 
     def show_db_sessions():
-        if not os.path.exists("recordings.db"):
-            messagebox.showinfo("DB", "No recordings.db file found.")
+        db_path = calibration.load_settings().get("db_path", DEFAULT_DB_PATH)
+        if not os.path.exists(db_path):
+            messagebox.showinfo("DB", f"No {db_path} file found.")
             return
-        conn = sqlite3.connect("recordings.db")
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM sessions ORDER BY id DESC LIMIT 10")
-        rows = cursor.fetchall()
-        conn.close()
+        sessions = get_catalog(db_path)
+        page_size = 50
+        cursors = [None]
+
         top = tk.Toplevel()
-        top.title("Recent Sessions")
-        text = tk.Text(top, wrap="none")
-        text.insert("1.0", "id | subject_id | session_id | timestamp | frame_count | file_base\n")
-        text.insert("2.0", "-" * 120 + "\n")
-        for row in rows:
-            text.insert("end", str(row) + "\n")
-        text.pack(expand=True, fill="both")
+        top.title(f"Sessions ({sessions.count_sessions()} total)")
+        filter_frame = tk.Frame(top)
+        filter_frame.pack(fill="x", padx=4, pady=4)
+        filters = {}
+        for label, key in (("Subject", "subject_id"), ("Session", "session_id"), ("Type", "task_type"),
+                           ("From", "start"), ("To", "end")):
+            tk.Label(filter_frame, text=label).pack(side=tk.LEFT)
+            filters[key] = tk.Entry(filter_frame, width=11)
+            filters[key].pack(side=tk.LEFT, padx=(2, 6))
+        tk.Label(top, text="Dates as YYYY-MM-DD", fg="gray", font=("Arial", 9)).pack(anchor="w", padx=4)
+
+        tree = ttk.Treeview(top, columns=SESSION_COLUMNS, show="headings", height=20)
+        for column in SESSION_COLUMNS:
+            tree.heading(column, text=column)
+            tree.column(column, width=260 if column == "file_base" else 90)
+        tree.pack(expand=True, fill="both")
+        tk.Label(top, text="Double-click a session for its keyframe timeline", fg="gray", font=("Arial", 9)).pack(anchor="w", padx=4)
+
+        def open_timeline(event):
+            item = tree.identify_row(event.y)
+            if not item:
+                return
+            hdf5_file = str(tree.set(item, "file_base")) + ".h5"
+            if not os.path.exists(hdf5_file):
+                messagebox.showerror("Timeline", f"{hdf5_file} not found.", parent=top)
+                return
+            if not converter.preview_timeline(hdf5_file, root.after, scale=PREVIEW_SCALES[preview_scale_combo.get()]):
+                messagebox.showinfo("Timeline", f"{hdf5_file} has no frames.", parent=top)
+
+        tree.bind("<Double-1>", open_timeline)
+
+        nav_frame = tk.Frame(top)
+        nav_frame.pack(fill="x", pady=4)
+        page_label = tk.Label(nav_frame)
+
+        def load_page():
+            criteria = {key: entry.get().strip() or None for key, entry in filters.items()}
+            try:
+                rows, next_cursor = sessions.query_sessions(limit=page_size, cursor=cursors[-1], **criteria)
+            except ValueError as e:
+                messagebox.showerror("Filter Error", str(e), parent=top)
+                return
+            tree.delete(*tree.get_children())
+            for row in rows:
+                tree.insert("", "end", values=[row[column] for column in SESSION_COLUMNS])
+            next_button.config(state=tk.NORMAL if next_cursor else tk.DISABLED)
+            prev_button.config(state=tk.NORMAL if len(cursors) > 1 else tk.DISABLED)
+            page_label.config(text=f"Page {len(cursors)}")
+            return next_cursor
+
+        def apply_filters():
+            del cursors[1:]
+            page_state["next"] = load_page()
+
+        def next_page():
+            if page_state["next"] is not None:
+                cursors.append(page_state["next"])
+                page_state["next"] = load_page()
+
+        def prev_page():
+            if len(cursors) > 1:
+                cursors.pop()
+                page_state["next"] = load_page()
+
+        page_state = {"next": None}
+        prev_button = tk.Button(nav_frame, text="◀ Newer", command=prev_page)
+        prev_button.pack(side=tk.LEFT, padx=4)
+        page_label.pack(side=tk.LEFT, padx=4)
+        next_button = tk.Button(nav_frame, text="Older ▶", command=next_page)
+        next_button.pack(side=tk.LEFT, padx=4)
+        tk.Button(filter_frame, text="Search", command=apply_filters).pack(side=tk.LEFT)
+        apply_filters()
+
+    def resolve_camera_source(selected_source, fps):
+        if selected_source == "synthetic":
+            return f"synthetic:@{fps}"
+        if selected_source == "replay":
+            return filedialog.askopenfilename(filetypes=[("Recordings", "*.avi *.h5")]) or None
+        return int(selected_source)
 
     def start_recording():
-        nonlocal frames, frame_count, last_output_dir
+        nonlocal frame_count, last_output_dir
         subject_id = subject_entry.get().strip().replace('\n', '').replace('\r', '')
         session_id = session_entry.get().strip().replace('\n', '').replace('\r', '')
         task_type = task_combo.get()
@@ -93,9 +161,14 @@ def launch_app():
 
         gain = float(gain) if gain.strip() != '' else 128
         exposure = float(exposure) if exposure.strip() != '' else None
+        try:
+            pretrigger_seconds = float(pretrigger_entry.get().strip() or 0)
+        except ValueError:
+            messagebox.showerror("Input Error", "Pre-trigger seconds must be a number")
+            return
 
         selected_label = camera_combo.get()
-        selected_index = int(selected_label.split(" - ")[0])
+        selected_source = selected_label.split(" - ")[0]
 
         if not subject_id or not session_id or not fps or not total_frames or not output_dir or not filename_base:
             messagebox.showerror("Input Error", "Please enter all fields.")
@@ -105,65 +178,229 @@ def launch_app():
 
         last_output_dir = output_dir
 
-        if selected_index >= 2:
-            messagebox.showinfo("Simulated Device", f"'{selected_label}' is a placeholder and not a real camera.")
+        segment_text = segment_entry.get().strip()
+        if segment_text and not segment_text.isdigit():
+            messagebox.showerror("Input Error", "Split every N frames must be an integer")
             return
+        segment_frames = int(segment_text) if segment_text else None
 
-        cap = camera.initialize_camera(selected_index)
-        camera.set_camera_settings(cap, gain, exposure)
-        frames.clear()
-        frame_count = 0
-
-        window_name = "Recording... Press 'q' to stop early. "
-        cv2.namedWindow(window_name)
+        try:
+            preview_hz = float(preview_hz_entry.get().strip() or 0)
+        except ValueError:
+            messagebox.showerror("Input Error", "Preview Hz must be a number")
+            return
 
-        while frame_count < total_frames:
-            frame = camera.read_frame(cap)
-            cv2.imshow(window_name, frame)
-            frames.append(frame)
-            frame_count += 1
-            if cv2.waitKey(int(1000/fps)) & 0xFF == ord('q'):
-                break
+        try:
+            roi = parse_roi(roi_entry.get())
+        except ValueError as e:
+            messagebox.showerror("Input Error", str(e))
+            return
+        average_text = average_entry.get().strip() or "1"
+        if not average_text.isdigit() or int(average_text) < 1:
+            messagebox.showerror("Input Error", "Average every N frames must be a positive integer")
+            return
+        preprocess = {"roi": roi, "binning": int(binning_combo.get()), "channel": preprocess_channel_combo.get(),
+                      "average": int(average_text)}
+
+        gate = None
+        if gate_threshold_entry.get().strip():
+            try:
+                gate = ActivityGate.options(float(gate_threshold_entry.get()), fps / preprocess["average"],
+                                            float(gate_pre_entry.get() or 0), float(gate_post_entry.get() or 0))
+            except ValueError:
+                messagebox.showerror("Input Error", "Motion gate threshold and padding must be numbers")
+                return
+
+        extra_text = extra_cameras_entry.get().strip()
+        extra_indices = [part.strip() for part in extra_text.split(",") if part.strip()]
+        if not all(part.isdigit() for part in extra_indices):
+            messagebox.showerror("Input Error", "Extra cameras must be comma-separated device indices (e.g. 1,2)")
+            return
 
-        camera.release_camera(cap)
+        source = resolve_camera_source(selected_source, fps)
+        if source is None:
+            return
+        # Streams are labelled by device (cam0, cam1, ...); the label only
+        # shows up in file names when more than one camera is recorded.
+        sources = {f"cam{selected_source}" if selected_source.isdigit() else selected_source: source}
+        for part in extra_indices:
+            sources.setdefault(f"cam{part}", int(part))
+        multi = len(sources) > 1
 
         bids_path = os.path.join(output_dir, f"sub-{subject_id}", f"ses-{session_id}", task_type)
         os.makedirs(bids_path, exist_ok=True)
         file_base = os.path.join(bids_path, filename_base)
-        video_file = file_base + ".avi"
-        hdf5_file = file_base + ".h5"
-        json_file = file_base + "_metadata.json"
-        channel_dir = file_base + "_channels"
-
-        height, width, _ = frames[0].shape
-        out = cv2.VideoWriter(video_file, cv2.VideoWriter_fourcc(*'XVID'), fps, (width, height))
-        for f in frames:
-            out.write(f)
-        out.release()
 
-        converter.save_frames_to_hdf5(frames, hdf5_file)
-        if save_channels_var.get():
-            converter.split_and_save_channels(frames, channel_dir)
+        caps = {}
+        for label, stream_source in sources.items():
+            try:
+                caps[label] = camera.initialize_camera(stream_source)
+            except RuntimeError as e:
+                for opened in caps.values():
+                    opened.release()
+                messagebox.showerror("Camera Error", f"'{label}': {e}")
+                return
+            camera.set_camera_settings(caps[label], gain, exposure)
+        frame_count = 0
 
+        settings = calibration.load_settings()
+        recorder = MultiCameraRecorder(caps, total_frames, fps, policy=policy_combo.get(), pretrigger_seconds=pretrigger_seconds,
+                                       profile=settings.get("profile", False), preprocess=preprocess, gate=gate)
+
+        # Preview, encoding and HDF5 writing each run on their own stage
+        # thread so a slow consumer never stalls the capture thread.
+        def on_preview_key(key):
+            if key == ord('q'):
+                recorder.stop()
+            elif key == ord('t'):
+                recorder.trigger()
+
+        encoders = {}
+        previews = {}
+        for label, pipeline in recorder.pipelines.items():
+            if pretrigger_seconds > 0:
+                window_name = f"Armed ({pretrigger_seconds:g}s pre-trigger)... Press 't' to trigger, 'q' to stop. "
+            else:
+                window_name = "Recording... Press 'q' to stop early. "
+            if multi:
+                window_name = f"[{label}] {window_name}"
+            stream_base = recording.stream_file_base(file_base, label, multi)
+            previews[label] = LivePreview(window_name, pipeline, max_hz=preview_hz,
+                                          scale=PREVIEW_SCALES[preview_scale_combo.get()],
+                                          overlay=preview_overlay_var.get(), on_key=on_preview_key)
+            pipeline.add_stage("preview", previews[label], policy=DROP_OLDEST, maxsize=1, live=True)
+            encoders[label], _ = recording.add_storage_stages(
+                pipeline, stream_base + ".avi", stream_base + ".h5", pipeline.output_fps,
+                codec=settings.get("hdf5_codec", "gzip"), chunks=settings.get("hdf5_chunks"),
+                fourcc=video_codec_combo.get(), segment_frames=segment_frames,
+                raw_file=stream_base + ".npy" if save_raw_var.get() else None,
+            )
+
+        def finish_recording():
+            nonlocal frame_count
+            try:
+                recorder.join()
+            except Exception as e:
+                messagebox.showerror("Recording Error", str(e))
+                return
+            finally:
+                for preview in previews.values():
+                    preview.close()
+                for cap in caps.values():
+                    camera.release_camera(cap)
+                record_button.config(state=tk.NORMAL)
+            frame_count = max(pipeline.frame_count for pipeline in recorder.pipelines.values())
+            if frame_count == 0:
+                messagebox.showinfo("Not Recorded", "Stopped before any frames were recorded.")
+                return
+
+            extra_metadata = {}
+            if multi:
+                sync_file = recorder.write_sync_table(file_base + "_sync.tsv")
+                extra_metadata["sync_table"] = os.path.basename(sync_file)
+                extra_metadata["streams"] = recorder.labels
+
+            channels = None
+            if save_channels_var.get():
+                channels = "hdf5" if channel_mode_combo.get() == "HDF5 datasets" else "jpeg"
+            empty = []
+            for label, pipeline in recorder.pipelines.items():
+                # A stream can stop with no frames (a camera that failed to
+                # start, or gated throughout) while the others recorded.
+                if pipeline.frame_count == 0:
+                    empty.append(label)
+                    continue
+                stream_metadata = dict(extra_metadata, camera=label) if multi else dict(extra_metadata)
+                stream_metadata["video"] = {
+                    "codec": encoders[label].fourcc,
+                    "files": [os.path.basename(path) for path in encoders[label].files],
+                }
+                stream_metadata["preview"] = previews[label].stats()
+                if save_raw_var.get():
+                    stream_base = recording.stream_file_base(file_base, label, multi)
+                    stream_metadata["raw"] = {
+                        "file": os.path.basename(stream_base + ".npy"),
+                        "sidecar": os.path.basename(rawstore.sidecar_path(stream_base + ".npy")),
+                    }
+                recording.finalize_stream(
+                    recording.stream_file_base(file_base, label, multi), subject_id, session_id, task_type,
+                    pipeline.frame_count, {"gain": gain, "exposure": exposure, "fps": fps}, pipeline,
+                    channels=channels, db_path=settings.get("db_path", DEFAULT_DB_PATH), extra_metadata=stream_metadata,
+                )
+
+            message = f"Recording saved to:\n{file_base}*"
+            if empty:
+                message += f"\n\nNo frames recorded from: {', '.join(empty)}"
+            messagebox.showinfo("Done", message)
+            open_button.config(state=tk.NORMAL)
+
+        # The preview windows are drawn from here, on the Tk main thread,
+        # polled at least as often as they refresh.
+        poll_ms = min(50, max(1, int(1000 / preview_hz))) if preview_hz > 0 else 5
+
+        def poll_recording():
+            if recorder.is_alive():
+                for preview in previews.values():
+                    preview.show()
+                root.after(poll_ms, poll_recording)
+            else:
+                finish_recording()
 
-        meta = metadata.generate_metadata(subject_id, session_id, frame_count, {
-            "gain": gain,
-            "exposure": exposure,
-            "fps": fps
-        })
-        metadata.save_metadata_to_json(meta, json_file)
+        record_button.config(state=tk.DISABLED)
+        recorder.start()
+        poll_recording()
 
-        conn = database.initialize_database()
-        database.insert_session_metadata(conn, subject_id, session_id, meta['timestamp'], frame_count, file_base)
-        conn.close()
+    def calibrate_hdf5():
+        fps_text = fps_entry.get()
+        if not fps_text.isdigit():
+            messagebox.showerror("Input Error", "FPS input must be an integer")
+            return
+        fps = int(fps_text)
+        selected_label = camera_combo.get()
+        source = resolve_camera_source(selected_label.split(" - ")[0], fps)
+        if source is None:
+            return
+        try:
+            cap = camera.initialize_camera(source)
+        except RuntimeError as e:
+            messagebox.showerror("Camera Error", f"'{selected_label}': {e}")
+            return
 
-        messagebox.showinfo("Done", f"Recording saved to:\n{file_base}.*")
-        open_button.config(state=tk.NORMAL)
+        outcome = {}
+
+        def run():
+            try:
+                outcome["result"] = calibration.calibrate(cap, fps)
+            except Exception as e:
+                outcome["error"] = e
+            finally:
+                cap.release()
+
+        def poll():
+            if worker.is_alive():
+                root.after(100, poll)
+                return
+            calibrate_button.config(state=tk.NORMAL)
+            if "error" in outcome:
+                messagebox.showerror("Calibration Error", str(outcome["error"]))
+                return
+            results, best = outcome["result"]
+            top = tk.Toplevel()
+            top.title("HDF5 Codec Calibration")
+            text = tk.Text(top, wrap="none", font=("Courier", 10))
+            text.insert("1.0", calibration.format_results(results, best))
+            text.insert("end", f"\n\nSaved '{best['codec']}' for {fps} FPS to {calibration.SETTINGS_FILE}")
+            text.pack(expand=True, fill="both")
+
+        calibrate_button.config(state=tk.DISABLED)
+        worker = threading.Thread(target=run, daemon=True)
+        worker.start()
+        poll()
 
     def preview_hdf5_file():
         file_path = filedialog.askopenfilename(filetypes=[("HDF5 files", "*.h5")])
         if file_path:
-            converter.preview_hdf5(file_path)
+            converter.preview_hdf5(file_path, root.after, scale=PREVIEW_SCALES[preview_scale_combo.get()])
 
     def open_last_output():
         if last_output_dir:
@@ -179,7 +416,7 @@ def launch_app():
 
     root = tk.Tk()
     root.title("📹 Webcam Scientific Recorder")
-    root.geometry("500x740")
+    root.geometry("500x960")
     root.configure(bg="#f0f0f5")
 
     def labeled_entry(label_text, help_text=None):
@@ -221,14 +458,15 @@ def launch_app():
     fps_entry.pack(fill="x")
     #tk.Label(fps_left, text="Must be an integer (e.g., 20, 30)", bg="#f0f0f5", fg="gray", font=("Arial", 9)).pack(anchor="w")
 
-    try:
-        probe_cam = cv2.VideoCapture(0)
-        fps_range = probe_cam.get(cv2.CAP_PROP_FPS)
-        fps_label = tk.Label(root, text=f"⚙️Must be an integer; Your built-in camera reports max FPS: {fps_range:.1f}", fg="gray", bg="#f0f0f5")
-        fps_label.pack()
-        probe_cam.release()
-    except Exception as e:
-        print("FPS check failed:", e)
+    # Filled in from the discovery cache / background probe of device 0
+    fps_label = tk.Label(root, text="⚙️Must be an integer; checking built-in camera FPS...", fg="gray", bg="#f0f0f5")
+    fps_label.pack()
+
+    def update_fps_label(info):
+        if info.get("available") and info.get("fps"):
+            fps_label.config(text=f"⚙️Must be an integer; Your built-in camera reports max FPS: {info['fps']:.1f}")
+        else:
+            fps_label.config(text="⚙️Must be an integer")
 
     frame_mode = tk.StringVar(value="frame") 
 
@@ -379,27 +617,131 @@ def launch_app():
     #filename_entry = labeled_entry("Custom File Label", "e.g. sub-01_ses-01_func_task-video")
 
     tk.Label(root, text="Camera Device", bg="#f0f0f5", font=("Arial", 11)).pack()
-    camera_options = []
-    for i in range(4):
-        cap = cv2.VideoCapture(i)
-        if cap is not None and cap.read()[0]:
-            name = f"{i} - Built-in Camera" if i == 0 else f"{i} - Camera {i}"
-            if "obs" in cap.getBackendName().lower():
-                name += " (OBS VirtualCam)"
-            camera_options.append(name)
-            cap.release()
-        else:
-            camera_options.append(f"{i} - (Unavailable)")
-
-    camera_combo = ttk.Combobox(root, font=("Arial", 10), values=camera_options, state="readonly")
+    # Devices are probed in the background; a warm start lists them from the
+    # discovery cache straight away and revalidates once the window is up.
+    discovery = CameraDiscovery(range(4))
+    device_labels = {i: f"{i} - (Detecting...)" for i in discovery.indices}
+    for info in discovery.cached_devices():
+        device_labels[info["index"]] = device_label(info)
+        if info["index"] == 0:
+            update_fps_label(info)
+    extra_options = ["synthetic - Test Pattern", "replay - From File..."]
+
+    camera_combo = ttk.Combobox(root, font=("Arial", 10), values=list(device_labels.values()) + extra_options, state="readonly")
     camera_combo.set("0 - Built-in Webcam")
     camera_combo.pack(pady=4)
 
+    def poll_discovery():
+        found = discovery.poll()
+        if found:
+            for info in found:
+                device_labels[info["index"]] = device_label(info)
+                if info["index"] == 0:
+                    update_fps_label(info)
+            selected = camera_combo.get()
+            camera_combo['values'] = list(device_labels.values()) + extra_options
+            selected_source = selected.split(" - ")[0]
+            if selected_source.isdigit() and int(selected_source) in device_labels:
+                camera_combo.set(device_labels[int(selected_source)])
+        if discovery.is_running() or found:
+            root.after(100, poll_discovery)
+
+    def start_discovery():
+        discovery.start()
+        poll_discovery()
+
+    root.after(1000 if discovery.has_cache() else 0, start_discovery)
+
 
     # Optional checkbox: whether to save RGB channels separately
     save_channels_var = tk.BooleanVar(value=True)
-    save_channels_check = tk.Checkbutton(root, text="Save RGB Channels Separately", variable=save_channels_var, bg="#f0f0f5", font=("Arial", 10))
-    save_channels_check.pack(anchor="w", padx=12)
+    channels_frame = tk.Frame(root, bg="#f0f0f5")
+    channels_frame.pack(anchor="w", padx=12)
+    save_channels_check = tk.Checkbutton(channels_frame, text="Save RGB Channels Separately", variable=save_channels_var, bg="#f0f0f5", font=("Arial", 10))
+    save_channels_check.pack(side=tk.LEFT)
+    channel_mode_combo = ttk.Combobox(channels_frame, font=("Arial", 10), values=["JPEG files", "HDF5 datasets"], state="readonly", width=14)
+    channel_mode_combo.set("JPEG files")
+    channel_mode_combo.pack(side=tk.LEFT, padx=4)
+
+    # Optional uncompressed .npy copy that analysis code can np.memmap
+    save_raw_var = tk.BooleanVar(value=False)
+    tk.Checkbutton(root, text="Also Save Raw Frames (.npy, memory-mappable)", variable=save_raw_var, bg="#f0f0f5", font=("Arial", 10)).pack(anchor="w", padx=12)
+
+    # Backpressure policy for the encode/HDF5 stages when they fall behind capture
+    policy_frame = tk.Frame(root, bg="#f0f0f5")
+    policy_frame.pack(anchor="w", padx=12)
+    tk.Label(policy_frame, text="When storage falls behind", bg="#f0f0f5", font=("Arial", 10)).pack(side=tk.LEFT)
+    policy_combo = ttk.Combobox(policy_frame, font=("Arial", 10), values=list(POLICIES), state="readonly", width=12)
+    policy_combo.set(BLOCK)
+    policy_combo.pack(side=tk.LEFT, padx=4)
+    tk.Label(policy_frame, text="Pre-trigger (s)", bg="#f0f0f5", font=("Arial", 10)).pack(side=tk.LEFT, padx=(8, 0))
+    pretrigger_entry = tk.Entry(policy_frame, font=("Arial", 10), width=5)
+    pretrigger_entry.insert(0, "0")
+    pretrigger_entry.pack(side=tk.LEFT, padx=4)
+
+    # AVI codec and optional rollover into numbered files
+    video_frame = tk.Frame(root, bg="#f0f0f5")
+    video_frame.pack(anchor="w", padx=12)
+    tk.Label(video_frame, text="Video codec", bg="#f0f0f5", font=("Arial", 10)).pack(side=tk.LEFT)
+    video_codec_combo = ttk.Combobox(video_frame, font=("Arial", 10), values=list(FOURCCS), state="readonly", width=7)
+    video_codec_combo.set("XVID")
+    video_codec_combo.pack(side=tk.LEFT, padx=4)
+    tk.Label(video_frame, text="Split every N frames", bg="#f0f0f5", font=("Arial", 10)).pack(side=tk.LEFT, padx=(8, 0))
+    segment_entry = tk.Entry(video_frame, font=("Arial", 10), width=7)
+    segment_entry.pack(side=tk.LEFT, padx=4)
+
+    # Additional devices recorded in sync with the selected camera
+    multi_frame = tk.Frame(root, bg="#f0f0f5")
+    multi_frame.pack(anchor="w", padx=12)
+    tk.Label(multi_frame, text="Extra cameras (e.g. 1,2)", bg="#f0f0f5", font=("Arial", 10)).pack(side=tk.LEFT)
+    extra_cameras_entry = tk.Entry(multi_frame, font=("Arial", 10), width=12)
+    extra_cameras_entry.pack(side=tk.LEFT, padx=4)
+
+    # Reduce frames before they are stored: crop, bin, pick a channel, average
+    preprocess_frame = tk.Frame(root, bg="#f0f0f5")
+    preprocess_frame.pack(anchor="w", padx=12)
+    tk.Label(preprocess_frame, text="ROI x,y,w,h", bg="#f0f0f5", font=("Arial", 10)).pack(side=tk.LEFT)
+    roi_entry = tk.Entry(preprocess_frame, font=("Arial", 10), width=14)
+    roi_entry.pack(side=tk.LEFT, padx=4)
+    tk.Label(preprocess_frame, text="Bin", bg="#f0f0f5", font=("Arial", 10)).pack(side=tk.LEFT, padx=(4, 0))
+    binning_combo = ttk.Combobox(preprocess_frame, font=("Arial", 10), values=["1", "2", "4", "8"], state="readonly", width=2)
+    binning_combo.set("1")
+    binning_combo.pack(side=tk.LEFT, padx=4)
+    preprocess_channel_combo = ttk.Combobox(preprocess_frame, font=("Arial", 10), values=list(PREPROCESS_CHANNELS), state="readonly", width=5)
+    preprocess_channel_combo.set("all")
+    preprocess_channel_combo.pack(side=tk.LEFT, padx=4)
+    tk.Label(preprocess_frame, text="Avg N", bg="#f0f0f5", font=("Arial", 10)).pack(side=tk.LEFT, padx=(4, 0))
+    average_entry = tk.Entry(preprocess_frame, font=("Arial", 10), width=3)
+    average_entry.insert(0, "1")
+    average_entry.pack(side=tk.LEFT, padx=4)
+
+    # Store only frames with motion (blank threshold records everything)
+    gate_frame = tk.Frame(root, bg="#f0f0f5")
+    gate_frame.pack(anchor="w", padx=12)
+    tk.Label(gate_frame, text="Motion gate (0-255)", bg="#f0f0f5", font=("Arial", 10)).pack(side=tk.LEFT)
+    gate_threshold_entry = tk.Entry(gate_frame, font=("Arial", 10), width=5)
+    gate_threshold_entry.pack(side=tk.LEFT, padx=4)
+    tk.Label(gate_frame, text="Pad before/after (s)", bg="#f0f0f5", font=("Arial", 10)).pack(side=tk.LEFT, padx=(4, 0))
+    gate_pre_entry = tk.Entry(gate_frame, font=("Arial", 10), width=4)
+    gate_pre_entry.insert(0, "0.5")
+    gate_pre_entry.pack(side=tk.LEFT, padx=2)
+    gate_post_entry = tk.Entry(gate_frame, font=("Arial", 10), width=4)
+    gate_post_entry.insert(0, "1.0")
+    gate_post_entry.pack(side=tk.LEFT, padx=2)
+
+    # Live preview refresh cap, downscale and FPS/queue overlay
+    preview_options_frame = tk.Frame(root, bg="#f0f0f5")
+    preview_options_frame.pack(anchor="w", padx=12)
+    tk.Label(preview_options_frame, text="Preview Hz", bg="#f0f0f5", font=("Arial", 10)).pack(side=tk.LEFT)
+    preview_hz_entry = tk.Entry(preview_options_frame, font=("Arial", 10), width=4)
+    preview_hz_entry.insert(0, "15")
+    preview_hz_entry.pack(side=tk.LEFT, padx=4)
+    tk.Label(preview_options_frame, text="Scale", bg="#f0f0f5", font=("Arial", 10)).pack(side=tk.LEFT, padx=(8, 0))
+    preview_scale_combo = ttk.Combobox(preview_options_frame, font=("Arial", 10), values=list(PREVIEW_SCALES), state="readonly", width=4)
+    preview_scale_combo.set("1/2")
+    preview_scale_combo.pack(side=tk.LEFT, padx=4)
+    preview_overlay_var = tk.BooleanVar(value=True)
+    tk.Checkbutton(preview_options_frame, text="FPS overlay", variable=preview_overlay_var, bg="#f0f0f5", font=("Arial", 10)).pack(side=tk.LEFT, padx=(8, 0))
 
     
     exposure_entry.bind("<FocusIn>", on_exposure_focus_in)
@@ -413,7 +755,8 @@ def launch_app():
 
 
 
-    tk.Button(root, text="🎬 Start Recording", font=("Arial", 11), bg="#4CAF50", fg="white", width=44, command=start_recording).pack(pady=6)
+    record_button = tk.Button(root, text="🎬 Start Recording", font=("Arial", 11), bg="#4CAF50", fg="white", width=44, command=start_recording)
+    record_button.pack(pady=6)
 
     preview_frame = tk.Frame(root, bg="#f0f0f5")
     preview_frame.pack(pady=4)
@@ -421,6 +764,8 @@ def launch_app():
     tk.Button(preview_frame, text="Preiew AVI", font=("Arial", 10), bg="#9C27B0", fg="white", width=13, command=preview_avi_file).grid(row=0, column=1, padx=2, pady=2)
     tk.Button(preview_frame, text="Preview JSON", font=("Arial", 10), bg="#795548", fg="white", width=13, command=view_json_metadata).grid(row=0, column=2, padx=2, pady=2)
     tk.Button(preview_frame, text="Preview DB", font=("Arial", 10), bg="#607D8B", fg="white", width=13, command=show_db_sessions).grid(row=0, column=3, padx=2, pady=2)
+    calibrate_button = tk.Button(preview_frame, text="Calibrate HDF5 Codec", font=("Arial", 10), bg="#009688", fg="white", width=28, command=calibrate_hdf5)
+    calibrate_button.grid(row=1, column=0, columnspan=2, padx=2, pady=2)
 
     # 📁 Open Folder
     open_button = tk.Button(root, text="📁 Open Last Output Folder", font=("Arial", 11), bg="#FFC107", fg="black", width=44, state=tk.DISABLED, command=open_last_output)